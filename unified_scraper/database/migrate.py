@@ -0,0 +1,184 @@
+"""
+Schema migrations for databases created before a model change. Fresh databases
+get everything from `Base.metadata.create_all`; existing ones run
+
+    python -m Database.migrate
+
+Every step checks the live schema first, so running it again is a no-op.
+"""
+import hashlib
+import json
+from sqlalchemy import inspect, text
+from Database.high_court_database import engine
+from Database.models import Document, link_hash, DOCUMENT_PENDING, DOCUMENT_UPLOADED
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def stored_links(raw):
+    """Links from a document_link value (JSON list, double-encoded JSON or a bare URL)."""
+    if not raw:
+        return []
+    value = raw
+    for _ in range(2):
+        if not isinstance(value, str):
+            break
+        try:
+            value = json.loads(value)
+        except ValueError:
+            break
+    if isinstance(value, str):
+        return [value.strip()]
+    if isinstance(value, list):
+        return [str(link).strip() for link in value if link]
+    return []
+
+
+def hash_for_row(raw_document_link):
+    links = stored_links(raw_document_link)
+    if len(links) == 1:
+        return link_hash(links[0])
+    # legacy rows holding several links are keyed on the whole list
+    return hashlib.sha256("\n".join(links).encode("utf-8")).hexdigest()
+
+
+def add_metadata_link_hash(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("MetaData")}
+    if "link_hash" in columns:
+        return
+    print("Adding MetaData.link_hash")
+    conn.execute(text("ALTER TABLE MetaData ADD COLUMN link_hash CHAR(64) NULL"))
+
+
+def backfill_metadata_link_hash(conn):
+    last_id, updated = 0, 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, document_link FROM MetaData "
+                "WHERE link_hash IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE MetaData SET link_hash = :hash WHERE id = :id"),
+            [{"id": row.id, "hash": hash_for_row(row.document_link)} for row in rows],
+        )
+        last_id = rows[-1].id
+        updated += len(rows)
+    if updated:
+        print(f"Backfilled link_hash on {updated} rows")
+
+
+def remove_metadata_duplicates(conn):
+    """Keep the oldest row per (court, case, link), carrying over a downloaded flag from its copies."""
+    same_key = (
+        "dup.high_court_id = keep.high_court_id AND dup.case_id = keep.case_id "
+        "AND dup.link_hash = keep.link_hash AND dup.id > keep.id"
+    )
+    conn.execute(text(
+        f"UPDATE MetaData keep JOIN MetaData dup ON {same_key} "
+        "SET keep.is_downloaded = TRUE WHERE dup.is_downloaded = TRUE"
+    ))
+    result = conn.execute(text(f"DELETE dup FROM MetaData dup JOIN MetaData keep ON {same_key}"))
+    if result.rowcount:
+        print(f"Removed {result.rowcount} duplicate MetaData rows")
+
+
+def add_metadata_unique_key(conn):
+    constraints = {c["name"] for c in inspect(conn).get_unique_constraints("MetaData")}
+    indexes = {i["name"] for i in inspect(conn).get_indexes("MetaData")}
+    if "uq_metadata_court_case_link" in constraints | indexes:
+        return
+    remove_metadata_duplicates(conn)
+    print("Adding unique key uq_metadata_court_case_link")
+    conn.execute(text(
+        "ALTER TABLE MetaData ADD CONSTRAINT uq_metadata_court_case_link "
+        "UNIQUE (high_court_id, case_id, link_hash)"
+    ))
+
+
+def create_documents_table(conn):
+    if inspect(conn).has_table(Document.__tablename__):
+        return
+    print("Creating Documents")
+    Document.__table__.create(conn)
+
+
+def backfill_documents(conn):
+    """One Documents row per link of every MetaData row that has none yet."""
+    last_id, created = 0, 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT m.id, m.high_court_id, m.document_link, m.is_downloaded FROM MetaData m "
+                "WHERE m.id > :last_id AND NOT EXISTS "
+                "(SELECT 1 FROM Documents d WHERE d.metadata_id = m.id) "
+                "ORDER BY m.id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        documents = [
+            {
+                "metadata_id": row.id,
+                "high_court_id": row.high_court_id,
+                "url": link,
+                "url_hash": link_hash(link),
+                "status": DOCUMENT_UPLOADED if row.is_downloaded else DOCUMENT_PENDING,
+            }
+            for row in rows
+            for link in dict.fromkeys(stored_links(row.document_link))
+        ]
+        if documents:
+            conn.execute(Document.__table__.insert(), documents)
+        last_id = rows[-1].id
+        created += len(documents)
+    if created:
+        print(f"Created {created} Documents rows")
+
+
+def update_documents_pending_index(conn):
+    """Keyset pagination of pending documents walks (high_court_id, status, id)."""
+    wanted = ["high_court_id", "status", "id"]
+    current = {i["name"]: i["column_names"] for i in inspect(conn).get_indexes("Documents")}
+    if current.get("ix_documents_pending") == wanted:
+        return
+    print("Rebuilding index ix_documents_pending")
+    if "ix_documents_pending" in current:
+        conn.execute(text("DROP INDEX ix_documents_pending ON Documents"))
+    conn.execute(text("CREATE INDEX ix_documents_pending ON Documents (high_court_id, status, id)"))
+
+
+def add_documents_content_hash_index(conn):
+    """Content-store lookups (already uploaded? which blob?) go by content_hash."""
+    indexes = {i["name"] for i in inspect(conn).get_indexes("Documents")}
+    if "ix_documents_content_hash" in indexes:
+        return
+    print("Adding index ix_documents_content_hash")
+    conn.execute(text("CREATE INDEX ix_documents_content_hash ON Documents (content_hash)"))
+
+
+MIGRATIONS = [
+    add_metadata_link_hash,
+    backfill_metadata_link_hash,
+    add_metadata_unique_key,
+    create_documents_table,
+    backfill_documents,
+    update_documents_pending_index,
+    add_documents_content_hash_index,
+]
+
+
+def migrate():
+    for step in MIGRATIONS:
+        with engine.begin() as conn:
+            step(conn)
+    print("Database schema is up to date.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,8 +1,21 @@
-from sqlalchemy import Column, Integer, String, Date, Text, Boolean, ForeignKey, TIMESTAMP, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, Date, Text, Boolean, ForeignKey, TIMESTAMP, UniqueConstraint, CHAR, Index
 from sqlalchemy.orm import relationship
 from Database.high_court_database import Base
 from sqlalchemy.sql import func
 from sqlalchemy import JSON 
+import hashlib
+
+# Document.status values
+DOCUMENT_PENDING = "pending"
+DOCUMENT_FAILED = "failed"        # retried until MAX_DOCUMENT_ATTEMPTS
+DOCUMENT_UPLOADED = "uploaded"
+MAX_DOCUMENT_ATTEMPTS = 5
+
+
+def link_hash(link: str) -> str:
+    """Stable SHA-256 of a document URL, used in unique keys instead of the URL itself."""
+    return hashlib.sha256(link.strip().encode("utf-8")).hexdigest()
+
 
 class HighCourt(Base):
     __tablename__ = "HighCourts"
@@ -18,6 +31,9 @@ class HighCourt(Base):
 
 class MetaData(Base):
     __tablename__ = "MetaData"
+    __table_args__ = (
+        UniqueConstraint("high_court_id", "case_id", "link_hash", name="uq_metadata_court_case_link"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     high_court_id = Column(Integer, ForeignKey("HighCourts.id", ondelete="CASCADE"), nullable=False)
@@ -25,9 +41,36 @@ class MetaData(Base):
     judgement_date = Column(Date)
     party_detail = Column(Text)
     document_link = Column(JSON, nullable=True)
+    link_hash = Column(CHAR(64), nullable=True)
     is_downloaded = Column(Boolean, default=False)
     scrapped_at = Column(TIMESTAMP, server_default=func.now())
 
     highcourt = relationship("HighCourt", back_populates="judgments")
+    documents = relationship("Document", back_populates="judgment", cascade="all, delete-orphan")
+
+
+class Document(Base):
+    """One row per document URL of a MetaData row, with its own download/upload state."""
+    __tablename__ = "Documents"
+    __table_args__ = (
+        UniqueConstraint("metadata_id", "url_hash", name="uq_documents_metadata_url"),
+        Index("ix_documents_pending", "high_court_id", "status", "id"),
+        Index("ix_documents_content_hash", "content_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    metadata_id = Column(Integer, ForeignKey("MetaData.id", ondelete="CASCADE"), nullable=False)
+    # copied from MetaData so "pending for court X" is answered from this table's index
+    high_court_id = Column(Integer, ForeignKey("HighCourts.id", ondelete="CASCADE"), nullable=False)
+    url = Column(Text, nullable=False)
+    url_hash = Column(CHAR(64), nullable=False)
+    status = Column(String(20), nullable=False, default=DOCUMENT_PENDING, server_default=DOCUMENT_PENDING)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    blob_path = Column(String(1024), nullable=True)
+    content_hash = Column(CHAR(64), nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    judgment = relationship("MetaData", back_populates="documents")
 
  
@@ -1,6 +1,6 @@
-import subprocess
-import os,logging
+import os
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 import sys
 from pathlib import Path
@@ -8,82 +8,66 @@ from pathlib import Path
 project_root = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(project_root))
 
-from unified_scraper.utils.pdf_downloader import get_pending_pdfs, download_and_update
-from unified_scraper.utils.insert_csv_to_database import insert_judgments_from_csv
-from Database.high_court_database import SessionLocal
-from unified_scraper.utils.upload_to_azure import upload_to_azure
+from unified_scraper.utils.pdf_downloader import download_and_update
+from unified_scraper.utils.document_stream import DocumentStream
 from unified_scraper.utils.upload_logs_to_azure import upload_crawl_log
+from unified_scraper.utils.run_manifest import RunManifest
+from unified_scraper.utils.crawl_runner import SpiderRun
+from unified_scraper.utils.pipeline_runtime import configure_logging, run_summary
 
-logging.basicConfig(
-    filename="crawl.log",
-    filemode="a",  # use "w" to overwrite every run
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    level=logging.INFO
-)
-
-def run_pdf_download(root_folder,high_court_name,bench_name):
-    session = SessionLocal()
-    try:
-        pdf_items = get_pending_pdfs(session,high_court_name,bench_name)
-        if not pdf_items:
-            print("No pending PDFs to download.")
-            return
-        downloaded_files = download_and_update(session, pdf_items,output_root_folder=root_folder)
-        return downloaded_files
-    finally:
-        session.close()
-
-
-def run_upload(downloaded_files, root_folder):
-    session = SessionLocal()
-    try:
-        upload_to_azure(session, downloaded_files,local_base=root_folder)
-    finally:
-        session.close()
+COURT = "delhc"
 
 
-def run_spider(spider_name, output_csv):
+def run_spider(spider_name, output_csv=None, settings=None):
+    """
+    Crawl in this process; items go to MetaData through MetaDataPipeline and come
+    back in the returned SpiderJob with the stats. `output_csv` is only a debug copy.
+    """
     print(" Running Scrapy spider...")
-    try:
-        subprocess.run(
-            ["scrapy", "crawl", spider_name, "-o", output_csv],
-            check=True
-        )
-        print(f"Spider finished. Output saved to {output_csv}")
-    except subprocess.CalledProcessError as e:
-        print(f"Spider failed: {e}")
-        raise
-
-
-def main():
+    run = SpiderRun(settings)
+    job = run.add(spider_name, feed=output_csv)
+    run.run()
+    if job.error:
+        print(f"Spider failed: {job.error}")
+        raise job.error
+    print(f"Spider finished. {len(job.items)} items stored in the database.")
+    return job
+
+
+def main(scrapy_settings=None):
+    """Run the Delhi pipeline; `scrapy_settings` override the crawl's settings. Returns a run summary."""
     high_court_name = "Delhi High Court"
     bench_name = None
-    output_csv = "delhi_result.csv"
+    output_csv = "delhi_result.csv" if os.getenv("DEBUG_CSV") else None
     root_folder = datetime.today().strftime("%Y")
+    # a run that died is resumed: finished stages and downloaded files are skipped
+    manifest = RunManifest(COURT)
+    downloaded_files, error = [], None
+    spiders = []
 
     try:
-        # Step 1: Run spider
-        run_spider("delhi_spider", output_csv)
-
-        # Step 2: Insert CSV into database
-        print("\n Inserting records into database...")
-        insert_judgments_from_csv(
-            csv_path=output_csv,
-            high_court_name=high_court_name,
-            base_link="https://delhihighcourt.nic.in",
-            bench_name=bench_name,
-            pdf_folder="delhc"
-        )
-        print("Database insertion completed.")
-
-        downloaded_files = run_pdf_download(root_folder, high_court_name, bench_name)
-
-        if downloaded_files:
-            run_upload(downloaded_files, root_folder)
-        else:
-            print("No files downloaded, skipping upload.")
+        # records are inserted while the spider crawls, and downloaded, converted
+        # and uploaded as they appear; files an earlier attempt downloaded are reused
+        stream = DocumentStream(
+            COURT, high_court_name, [bench_name], root_folder,
+            partial(download_and_update, output_root_folder=root_folder), run_id=manifest.run_id,
+        ).start()
+        try:
+            if not manifest.stage_done("crawl"):
+                spiders.append(run_spider("delhi_spider", output_csv, settings=scrapy_settings))
+                manifest.finish_stage("crawl")
+        finally:
+            stream.crawl_finished()
+            downloaded_files = stream.join()
+
+        if not downloaded_files:
+            print("No pending PDFs downloaded.")
+        if stream.errors:
+            raise RuntimeError("; ".join(stream.errors))
+        manifest.finish()
 
     except Exception as e:
+        error = e
         print(f"Pipeline failed with error: {e}")
 
     finally:
@@ -91,7 +75,11 @@ def main():
             upload_crawl_log(local_log_path="crawl.log", user_choice="delhc")
         except Exception as log_err:
             print(f" Failed to upload crawl.log: {log_err}")
+        summary = run_summary(COURT, manifest, downloaded_files, error, spiders)
+        manifest.close()
+    return summary
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
\ No newline at end of file
@@ -1,4 +1,3 @@
-import subprocess
 import os
 from datetime import datetime
 from pathlib import Path
@@ -8,65 +7,62 @@ from pathlib import Path
 project_root = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(project_root))
 
-from unified_scraper.utils.upload_to_azure import upload_to_azure
-from unified_scraper.utils.insert_csv_to_database import insert_judgments_from_csv
-from Database.high_court_database import SessionLocal
-from unified_scraper.spiders.link_to_pdf import SUCCESSFUL_PDFS,PHHCCaseSpider
+from unified_scraper.utils.document_stream import UploadStage
+from unified_scraper.spiders.link_to_pdf import COURT, PHHCCaseSpider
 from unified_scraper.utils.upload_logs_to_azure import upload_crawl_log
-from scrapy.crawler import CrawlerProcess
+from unified_scraper.utils.run_manifest import RunManifest
+from unified_scraper.utils.crawl_runner import SpiderRun
+from unified_scraper.utils.pipeline_runtime import configure_logging, run_summary
 
-def run_upload(downloaded_files, root_folder):
-    session = SessionLocal()
-    try:
-        upload_to_azure(session, downloaded_files,local_base=root_folder)
-    finally:
-        session.close()
-
-
-def run_spider(spider_name, output_csv):
-    print(" Running Scrapy spider...")
-    try:
-        subprocess.run(
-            ["scrapy", "crawl", spider_name, "-o", output_csv],
-            check=True
-        )
-        print(f"Spider finished. Output saved to {output_csv}")
-    except subprocess.CalledProcessError as e:
-        print(f"Spider failed: {e}")
-        raise
 
-def run_pdf_spider():
-    process = CrawlerProcess()
-    process.crawl(PHHCCaseSpider)  
-    process.start()  
-
-
-def main():
-    output_csv = "haryana_result.csv"
-    high_court_name = "Punjab&Haryana High Court"
+def main(scrapy_settings=None):
+    """Run the PHHC pipeline; `scrapy_settings` override both crawls' settings. Returns a run summary."""
+    output_csv = "haryana_result.csv" if os.getenv("DEBUG_CSV") else None
     root_folder = datetime.today().strftime("%Y")
+    # a run that died is resumed: finished stages, crawl slices and downloads are skipped
+    manifest = RunManifest(COURT)
+    downloaded_files, spiders, error = [], [], None
 
     try:
-        run_spider("phhc_case_form_dynamic", output_csv)
-
-        print("\n Inserting records into database...")
-        insert_judgments_from_csv(
-            csv_path=output_csv,
-            high_court_name=high_court_name,
-            base_link="https://www.phhc.gov.in/home.php?search_param=free_text_search_judgment",
-            bench_name=None,
-            pdf_folder="phhc"
-        )
-        print("Database insertion completed.")
-        
-        run_pdf_spider()
-  
-        if SUCCESSFUL_PDFS:
-            run_upload(SUCCESSFUL_PDFS, root_folder=root_folder)
-        else:
-            print("No files downloaded, skipping upload.")
+        # both spiders run in this process: the PDF spider downloads documents while
+        # the listing spider is still inserting them, and every batch it saves is
+        # uploaded straight away
+        print(" Running Scrapy spiders...")
+        run = SpiderRun(scrapy_settings)
+        listing = None
+        if not manifest.stage_done("crawl"):
+            listing = run.add("phhc_case_form_dynamic", feed=output_csv, run_id=manifest.run_id)
+        uploads = UploadStage(root_folder)
+        try:
+            if not manifest.stage_done("download"):
+                run.add(
+                    PHHCCaseSpider, run_id=manifest.run_id, uploads=uploads,
+                    crawling=listing.running if listing else None,
+                )
+            elif not manifest.stage_done("upload"):
+                uploads.put([
+                    item for item in manifest.items("download").values() if os.path.exists(item["pdf_path"])
+                ])
+            spiders = run.run()
+        finally:
+            uploads.close()
+            downloaded_files = uploads.files
+        for job in spiders:
+            if job.error:
+                raise RuntimeError(f"Spider {job.name} failed: {job.error}")
+        if listing:
+            print(f"Spider finished. {len(listing.items)} items stored in the database.")
+            manifest.finish_stage("crawl")
+        manifest.finish_stage("download")
+        if uploads.errors:
+            raise RuntimeError("; ".join(uploads.errors))
+        manifest.finish_stage("upload")
+        if not downloaded_files:
+            print("No files downloaded.")
+        manifest.finish()
 
     except Exception as e:
+        error = e
         print(f" Pipeline failed with error: {e}")
 
     finally:
@@ -75,7 +71,11 @@ def main():
             upload_crawl_log(local_log_path="crawl.log", user_choice="phhc")
         except Exception as log_err:
             print(f"Failed to upload crawl.log: {log_err}")
+        summary = run_summary(COURT, manifest, downloaded_files, error, spiders)
+        manifest.close()
+    return summary
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -1,127 +1,114 @@
-import subprocess
 import os
+import json
 import sys
 import logging
 import shutil
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 project_root = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(project_root))
 
-from unified_scraper.utils.insert_csv_to_database import insert_judgments_from_csv_with_benches
-from unified_scraper.utils.pdf_downloader import get_pending_pdfs
-from Database.high_court_database import SessionLocal
-from unified_scraper.unified_scraper.utils.downloader_for_karnataka import download_pdfs
-from unified_scraper.utils.upload_to_azure import upload_to_azure
+from unified_scraper.unified_scraper.utils.downloader_for_karnataka import download_pdfs, bench_map
+from unified_scraper.utils.document_stream import DocumentStream
 from unified_scraper.utils.upload_logs_to_azure import upload_crawl_log
+from unified_scraper.utils.run_manifest import RunManifest
+from unified_scraper.utils.crawl_runner import SpiderRun
+from unified_scraper.utils.pipeline_runtime import configure_logging, run_summary
 
+COURT = "karhc"
 
-# Configure logger once → all spider + bench logs go to crawl.log
-logging.basicConfig(
-    filename="crawl.log",
-    filemode="w",
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    level=logging.INFO
-)
 
-
-def run_pdf_download(root_folder, high_court_name, bench_name):
-    session = SessionLocal()
+def bench_cookies_saved(bench_name):
+    """The crawl has saved this bench's session to cookies.json, which its downloads need."""
     try:
-        pdf_items = get_pending_pdfs(session, high_court_name, bench_name)
-        if not pdf_items:
-            logging.info(f"No pending PDFs to download for {bench_name}.")
-            return
-        downloaded_files = download_pdfs(pdf_items, root_folder=root_folder)
-        logging.info(f"Downloaded {len(downloaded_files)} PDFs for {bench_name}.")
-        return downloaded_files
-    except Exception as e:
-        logging.exception(f"PDF download failed for {bench_name}: {e}")
-    finally:
-        session.close()
+        with open("cookies.json") as f:
+            return any(bench_map.get(code) == bench_name for code in json.load(f))
+    except (OSError, ValueError):
+        return False
 
 
-def run_upload(downloaded_files, root_folder):
-    session = SessionLocal()
-    try:
-        upload_to_azure(session, downloaded_files, local_base=root_folder)
-        logging.info(f"Uploaded {len(downloaded_files)} PDFs to Azure.")
-    except Exception as e:
-        logging.exception(f"Upload failed: {e}")
-    finally:
-        session.close()
-
-
-def run_spider(spider_name, output_csv):
+def run_spider(spider_name, output_csv=None, settings=None):
+    """
+    Crawl in this process; items go to MetaData through MetaDataPipeline and come
+    back in the returned SpiderJob with the stats. `output_csv` is only a debug copy.
+    """
     logging.info(f"Running Scrapy spider: {spider_name}")
-    try:
-        subprocess.run(
-            ["scrapy", "crawl", spider_name, "-o", output_csv],
-            check=True
-        )
-        logging.info(f"Spider {spider_name} finished. Output saved to {output_csv}")
-    except subprocess.CalledProcessError as e:
-        logging.exception(f"Spider {spider_name} failed: {e}")
-        raise
-
-
-def main():
+    run = SpiderRun(settings)
+    job = run.add(spider_name, feed=output_csv)
+    run.run()
+    if job.error:
+        logging.error(f"Spider {spider_name} failed: {job.error}")
+        raise job.error
+    logging.info(f"Spider {spider_name} finished. {len(job.items)} items stored in the database.")
+    return job
+
+
+def main(scrapy_settings=None):
+    """Run the Karnataka pipeline; `scrapy_settings` override the crawl's settings. Returns a run summary."""
     high_court_name = "Karnataka High Court"
     bench_names = [
         "Bench at Kalburagi",
         "Bench at Dharwad",
         "Principal Bench at Bengaluru"
     ]
-    output_csv = "karnataka_results.csv"
+    output_csv = "karnataka_results.csv" if os.getenv("DEBUG_CSV") else None
     root_folder = datetime.today().strftime("%Y")
+    # a run that died is resumed: finished stages and downloaded files are skipped
+    manifest = RunManifest(COURT)
+    all_downloaded, errors = [], []
+    spiders = []
 
     try:
-        run_spider("karnataka_spider", output_csv)
+        # the downloads need the bench cookies the crawl leaves in cookies.json
+        crawl = not manifest.stage_done("crawl") or not os.path.exists("cookies.json")
+        if crawl and os.path.exists("cookies.json"):
+            # an earlier attempt's sessions; the crawl saves new ones bench by bench
+            os.remove("cookies.json")
+
+        # every bench is downloaded, converted and uploaded while the crawl runs,
+        # starting once the crawl has saved that bench's cookies
+        stream = DocumentStream(
+            COURT, high_court_name, bench_names, root_folder,
+            partial(download_pdfs, root_folder=root_folder), run_id=manifest.run_id, ready=bench_cookies_saved,
+        ).start()
+        try:
+            if crawl:
+                spiders.append(run_spider("karnataka_spider", output_csv, settings=scrapy_settings))
+                manifest.finish_stage("crawl")
+        finally:
+            stream.crawl_finished()
+            all_downloaded = stream.join()
+            errors += stream.errors
+        logging.info(f"Downloaded and uploaded {len(all_downloaded)} PDFs.")
 
         for bench_name in bench_names:
-            logging.info(f" Processing {bench_name}...")
-
+            temp_log = f"crawl_temp_{bench_name.replace(' ', '_')}.log"
             try:
-                insert_judgments_from_csv_with_benches(
-                    csv_path=output_csv,
-                    high_court_name=high_court_name,
-                    base_link="https://hcservices.ecourts.gov.in/hcservices/main.php",
-                    bench_name=bench_name,
-                    pdf_folder="karhc"
-                )
-                logging.info(f"Database insertion completed for {bench_name}.")
-
-                downloaded_files = run_pdf_download(root_folder, high_court_name, bench_name)
-
-                if downloaded_files:
-                    run_upload(downloaded_files, root_folder)
+                if os.path.exists("crawl.log"):
+                    shutil.copy("crawl.log", temp_log)
+                    upload_crawl_log(
+                        local_log_path=temp_log,
+                        user_choice=f"karhc/{bench_name.replace(' ', '_')}"
+                    )
+                    logging.info(f"✅ Uploaded crawl.log for {bench_name}")
                 else:
-                    logging.warning(f"No files downloaded for {bench_name}, skipping upload.")
-
-            except Exception as bench_err:
-                logging.exception(f"Error while processing {bench_name}: {bench_err}")
-
+                    logging.warning("⚠️ crawl.log not found for upload.")
+            except Exception as log_err:
+                logging.error(f"Failed during upload for {bench_name}: {log_err}")
             finally:
-                temp_log = f"crawl_temp_{bench_name.replace(' ', '_')}.log"
-                try:
-                    if os.path.exists("crawl.log"):
-                        shutil.copy("crawl.log", temp_log)
-                        upload_crawl_log(
-                            local_log_path=temp_log,
-                            user_choice=f"karhc/{bench_name.replace(' ', '_')}"
-                        )
-                        logging.info(f"✅ Uploaded crawl.log for {bench_name}")
-                    else:
-                        logging.warning("⚠️ crawl.log not found for upload.")
-                except Exception as log_err:
-                    logging.error(f"Failed during upload for {bench_name}: {log_err}")
-                finally:
-                    if os.path.exists(temp_log):
-                        os.remove(temp_log)
+                if os.path.exists(temp_log):
+                    os.remove(temp_log)
+
+        if stream.errors:
+            # left unfinished, so the next run resumes it (stream.errors are already in `errors`)
+            raise RuntimeError(f"{len(stream.errors)} download or upload error(s)")
+        manifest.finish()
 
     except Exception as e:
         # If pipeline fails before benches
+        errors.append(str(e))
         logging.exception(f"Pipeline failed with error: {e}")
         try:
             temp_log = "crawl_temp_pipeline.log"
@@ -134,15 +121,20 @@ def main():
             logging.error(f"Failed to upload crawl.log to spider folder: {log_err}")
 
     finally:
-        # Cleanup always
-        for file in ["cookies.json", output_csv, "results.xlsx","crawl.log"]:
-            if os.path.exists(file):
+        # Cleanup always (cookies.json stays while the run can still be resumed)
+        finished = manifest.is_finished()
+        summary = run_summary(COURT, manifest, all_downloaded, "; ".join(errors), spiders)
+        manifest.close()
+        for file in ["cookies.json" if finished else None, output_csv, "results.xlsx","crawl.log"]:
+            if file and os.path.exists(file):
                 try:
                     os.remove(file)
                     logging.info(f"Deleted file: {file}")
                 except Exception as e:
                     logging.info(f"Failed to delete {file}: {e}")
+    return summary
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
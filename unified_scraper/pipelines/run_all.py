@@ -0,0 +1,171 @@
+"""
+Runs the court pipelines side by side, one worker process per court, and writes
+one summary report, so a nightly run takes as long as the slowest court instead
+of the sum of all of them.
+
+    python pipelines/run_all.py
+    python pipelines/run_all.py --courts delhc phhc --work-dir /mnt/scratch/courts
+    python pipelines/run_all.py --backfill   # sweep the full windows, ignoring watermarks
+
+Every court works in its own directory under --work-dir (crawl.log, cookies.json,
+run manifest, captcha sessions, downloaded PDFs), so no two courts share a file;
+prints and Scrapy's console output go to console.log there. COURTS holds the
+per-court limits: environment for the download / text extraction / upload pools,
+and Scrapy settings such as concurrency and captcha budgets.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import logging
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+COURTS = {
+    "delhc": {
+        "module": "pipelines.delhi_pipeline",
+        "env": {"DOWNLOAD_CONCURRENCY_PER_HOST": "6", "DOWNLOAD_CONCURRENCY": "12", "UPLOAD_WORKERS": "4"},
+        "settings": {"CONCURRENT_REQUESTS": 16, "CONCURRENT_REQUESTS_PER_DOMAIN": 8},
+    },
+    "karhc": {
+        "module": "pipelines.karnataka_pipeline",
+        "env": {"DOWNLOAD_CONCURRENCY_PER_HOST": "4", "DOWNLOAD_CONCURRENCY": "8", "UPLOAD_WORKERS": "4"},
+        "settings": {
+            "CONCURRENT_REQUESTS": 16,
+            "CONCURRENT_REQUESTS_PER_DOMAIN": 8,
+            "CAPTCHA_RETRY_TIMES": {"karhc": 3},
+        },
+    },
+    "phhc": {
+        "module": "pipelines.haryana_pipeline",
+        "env": {"UPLOAD_WORKERS": "4"},
+        "settings": {
+            "CONCURRENT_REQUESTS": 16,
+            "CONCURRENT_REQUESTS_PER_DOMAIN": 8,
+            "CAPTCHA_RETRY_TIMES": {"phhc": 3},
+            "OCR_QUEUE_SIZE": 16,
+        },
+    },
+}
+
+SUMMARY_FILE = "summary.json"
+
+
+def court_config(court, cpu_share, backfill=False):
+    """COURTS[court] with the CPU-bound pools sized to this court's share of the cores."""
+    config = COURTS[court]
+    env = {
+        "TEXT_EXTRACTION_WORKERS": str(cpu_share),
+        # the in-process crawls find the project settings from these even when the work dir is elsewhere
+        "SCRAPY_SETTINGS_MODULE": "unified_scraper.settings",
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(project_root), os.environ.get("PYTHONPATH")])),
+        **config.get("env", {}),
+    }
+    settings = {"OCR_WORKERS": cpu_share, **config.get("settings", {})}
+    if backfill:
+        settings["CRAWL_BACKFILL"] = True
+    return {"module": config["module"], "env": env, "settings": settings}
+
+
+def run_court(court, config, court_dir):
+    """Worker process: run one court's pipeline in `court_dir` and leave its summary there."""
+    os.chdir(court_dir)
+    console = os.open("console.log", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(console, 1)
+    os.dup2(console, 2)
+    # DOWNLOAD_CONFIG, UPLOAD_CONFIG etc. are read on import, so the limits go in first
+    os.environ.update(config["env"])
+
+    pipeline = importlib.import_module(config["module"])
+    pipeline.configure_logging()
+    started = time.monotonic()
+    summary = pipeline.main(scrapy_settings=config["settings"])
+    summary["seconds"] = round(time.monotonic() - started, 1)
+    with open(SUMMARY_FILE, "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def read_summary(court, court_dir, exitcode):
+    path = os.path.join(court_dir, SUMMARY_FILE)
+    if exitcode == 0 and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    # the worker died before main() returned (killed, out of memory, import error)
+    return {"court": court, "status": "crashed", "error": f"worker exit code {exitcode}, see console.log"}
+
+
+def print_report(report):
+    print(f"\nRun finished in {report['seconds']:.0f}s")
+    for summary in report["courts"]:
+        line = f"  {summary['court']:<6} {summary['status']:<9} {summary.get('seconds', 0):>8.0f}s"
+        line += f"  {summary.get('downloaded', 0)} PDFs"
+        if summary.get("items_done"):
+            line += f"  {summary['items_done']}"
+        if summary.get("error"):
+            line += f"  error: {summary['error']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the court pipelines in parallel.")
+    parser.add_argument("--courts", nargs="+", choices=list(COURTS), default=list(COURTS))
+    parser.add_argument("--work-dir", default=str(project_root / "work"))
+    parser.add_argument("--backfill", action="store_true", help="crawl the full date windows, not from the watermarks")
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        filename=work_dir / "orchestrator.log",
+        filemode="a",
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        level=logging.INFO,
+    )
+    cpu_share = max(1, (os.cpu_count() or 1) // len(args.courts))
+
+    # spawn: each court imports its pipeline fresh, after its environment is set
+    context = multiprocessing.get_context("spawn")
+    started_at = datetime.now()
+    started = time.monotonic()
+    workers = {}
+    for court in args.courts:
+        court_dir = work_dir / court
+        court_dir.mkdir(exist_ok=True)
+        summary_path = court_dir / SUMMARY_FILE
+        if summary_path.exists():
+            summary_path.unlink()
+        worker = context.Process(
+            target=run_court, args=(court, court_config(court, cpu_share, args.backfill), str(court_dir)), name=court
+        )
+        worker.start()
+        workers[court] = worker
+        logging.info(f"Started {court} (pid {worker.pid}) in {court_dir}")
+
+    summaries = []
+    for court, worker in workers.items():
+        worker.join()
+        summary = read_summary(court, str(work_dir / court), worker.exitcode)
+        logging.info(f"{court} {summary['status']}: {summary}")
+        summaries.append(summary)
+
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "seconds": round(time.monotonic() - started, 1),
+        "courts": summaries,
+    }
+    report_path = work_dir / f"run_summary_{started_at:%Y%m%d_%H%M%S}.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report: {report_path}")
+    return 0 if all(s["status"] == "finished" for s in summaries) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
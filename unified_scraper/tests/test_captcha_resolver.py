@@ -0,0 +1,46 @@
+from itertools import accumulate
+
+from unified_scraper.utils.captcha_resolver import CaptchaStats, XEvil_CONFIG
+
+
+def stats_with(latencies):
+    stats = CaptchaStats("test", path=None)
+    stats.latencies.extend(latencies)
+    return stats
+
+
+def deadline(config=XEvil_CONFIG):
+    return config["initialDelay"] + config["interval"] * (config["retries"] - 1)
+
+
+def observed_latency(delays, solve_seconds):
+    """What solve_async records: the time of the first poll at or after the solve."""
+    return next(t for t in accumulate(delays) if t >= solve_seconds)
+
+
+def test_warm_up_probes_from_min_delay():
+    delays = stats_with([]).poll_delays(XEvil_CONFIG)
+    assert delays[0] == XEvil_CONFIG["minDelay"]
+    assert max(delays) <= XEvil_CONFIG["interval"]
+    assert sum(delays) >= deadline()
+
+
+def test_fast_solves_move_the_first_poll_earlier():
+    stats = stats_with([])
+    for solve_seconds in [0.8, 1.2, 1.5, 2.0, 0.9, 1.7, 1.1, 1.9, 1.4, 1.6]:
+        stats.latencies.append(observed_latency(stats.poll_delays(XEvil_CONFIG), solve_seconds))
+
+    delays = stats.poll_delays(XEvil_CONFIG)
+    assert delays[0] < XEvil_CONFIG["initialDelay"]
+    assert sum(delays) >= deadline()
+
+
+def test_first_poll_is_capped_at_initial_delay():
+    delays = stats_with([20.0] * XEvil_CONFIG["minSamples"]).poll_delays(XEvil_CONFIG)
+    assert delays[0] == XEvil_CONFIG["initialDelay"]
+    assert sum(delays) >= deadline()
+
+
+def test_first_poll_never_below_min_delay():
+    delays = stats_with([0.1] * XEvil_CONFIG["minSamples"]).poll_delays(XEvil_CONFIG)
+    assert delays[0] == XEvil_CONFIG["minDelay"]
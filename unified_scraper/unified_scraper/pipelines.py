@@ -13,6 +13,8 @@ class PhhcCrawlerPipeline:
         return item
 
 import pandas as pd
+from Database.high_court_database import SessionLocal
+from unified_scraper.utils.insert_csv_to_database import insert_judgment_rows
 
 class ExcelExportPipeline:
     def __init__(self):
@@ -26,3 +28,76 @@ class ExcelExportPipeline:
         if self.items:
             df = pd.DataFrame(self.items)
             df.to_excel("results.xlsx", index=False)
+
+
+class MetaDataPipeline:
+    """
+    Streams judgment items into MetaData while the crawl is running, buffering
+    them and flushing one multi-row upsert per DB_BATCH_SIZE items. Only spiders
+    that declare `high_court_name` (plus `base_link` and `pdf_folder`) are stored.
+    A spider with a `checkpoint(stored)` method is told after every flush, so it
+    can record progress only once the items behind it are in the database.
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.buffer = []
+        self.session = None
+        self.stored = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(batch_size=crawler.settings.getint("DB_BATCH_SIZE", 500))
+
+    def open_spider(self, spider):
+        if getattr(spider, "high_court_name", None):
+            self.session = SessionLocal()
+
+    def process_item(self, item, spider):
+        if self.session is None:
+            return item
+        self.buffer.append(ItemAdapter(item).asdict())
+        if len(self.buffer) >= self.batch_size:
+            self.flush(spider)
+        return item
+
+    def flush(self, spider):
+        rows, self.buffer = self.buffer, []
+        try:
+            stored, skipped = insert_judgment_rows(
+                self.session,
+                rows,
+                high_court_name=spider.high_court_name,
+                base_link=spider.base_link,
+                pdf_folder=spider.pdf_folder,
+            )
+        except Exception as e:
+            self.session.rollback()
+            spider.logger.error(f"Failed to store {len(rows)} items in MetaData: {e}")
+            spider.crawler.stats.inc_value("metadata/failed", len(rows))
+            self.checkpoint(spider, stored=False)
+            return
+        self.checkpoint(spider)
+
+        self.stored += stored
+        self.skipped += skipped
+        spider.crawler.stats.inc_value("metadata/stored", stored)
+        spider.crawler.stats.inc_value("metadata/skipped", skipped)
+
+    def checkpoint(self, spider, stored=True):
+        if hasattr(spider, "checkpoint"):
+            spider.checkpoint(stored)
+
+    def close_spider(self, spider):
+        if self.session is None:
+            return
+        try:
+            if self.buffer:
+                self.flush(spider)
+            else:
+                # slices that finished without new items
+                self.checkpoint(spider)
+            spider.logger.info(f"MetaData: {self.stored} stored, {self.skipped} skipped")
+        finally:
+            self.session.close()
@@ -9,6 +9,30 @@ CONCURRENT_REQUESTS = 100
 CONCURRENT_REQUESTS_PER_DOMAIN = 50
 DOWNLOAD_DELAY = 0.1
 
+# ASYNCIO REACTOR (captcha solving is awaited inside callbacks)
+TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+
+# CAPTCHA
+# CAPTCHA_POOL_SIZE: solved captcha sessions kept warm per spider (default: one per bench for karhc, 4 otherwise)
+CAPTCHA_RETRY_TIMES = {  # resubmissions with a fresh captcha per form, by court
+    "karhc": 3,
+    "phhc": 3,
+    "bombay": 3,
+}
+CAPTCHA_SESSION_MAX_AGE = {  # seconds a solved session is kept between requests and runs, by court (default 3600)
+    # nightly runs are a day apart; the court still says when a session has expired
+    "delhc": 26 * 3600,
+}
+
+# OCR (PDF text extraction in background worker processes)
+OCR_WORKERS = 0  # 0 = one per CPU core
+OCR_QUEUE_SIZE = 16  # PDFs waiting or in progress before callbacks wait for a slot
+
+# INCREMENTAL CRAWLING (per court / bench / case type watermarks, utils/watermarks.py)
+CRAWL_OVERLAP_DAYS = 3  # days before the watermark searched again, for late judgments
+CRAWL_BACKFILL = False  # ignore the watermarks and sweep the whole window
+CRAWL_BACKFILL_DAYS = 0  # window without a watermark or when backfilling; 0 = the spider's own (PHHC 60, Delhi 30, Karnataka 7)
+
 # HEADERS
 DEFAULT_REQUEST_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1)",
@@ -23,11 +47,15 @@ AUTOTHROTTLE_DEBUG = False
 
 # ITEM PIPELINES
 ITEM_PIPELINES = {
+    "unified_scraper.pipelines.MetaDataPipeline": 200,
     "unified_scraper.pipelines.ExcelExportPipeline": 300,
     # Add more pipelines as needed
 }
 
 
+# DATABASE
+DB_BATCH_SIZE = 500  # items per multi-row INSERT into MetaData
+
 # MIDDLEWARES (Uncomment if needed)
 # SPIDER_MIDDLEWARES = {
 #     "unified_scraper.middlewares.UnifiedSpiderMiddleware": 543,
@@ -2,13 +2,19 @@ import scrapy
 from bs4 import BeautifulSoup
 import re
 import math
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 from dotenv import load_dotenv
 import pandas as pd
 
+from unified_scraper.utils.session_manager import CaptchaSessionManager, cookies_from_headers
+from unified_scraper.utils.watermarks import WatermarkStore, crawl_start
+
 load_dotenv()
 
+COURT = "delhc"
+DEFAULT_DAYS = 30
+
 def clean_date(raw_date: str):
     """Parse and clean date strings like '01-01-2025 (pdf)' -> datetime.date"""
     if pd.isna(raw_date) or not str(raw_date).strip():
@@ -22,12 +28,58 @@ def clean_date(raw_date: str):
 class DelhiJudgmentsSpider(scrapy.Spider):
     name = "delhi_spider"
     allowed_domains = ["delhihighcourt.nic.in"]
+
+    # used by MetaDataPipeline
+    high_court_name = "Delhi High Court"
+    base_link = "https://delhihighcourt.nic.in"
+    pdf_folder = "delhc"
+
     start_url_str = os.getenv("DELHI_START_URL")  
     if start_url_str:
         start_urls = [start_url_str]  # wrap string in a list
     else:
         start_urls = []
         
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.sessions = CaptchaSessionManager(
+            crawler_stats=crawler.stats, max_ages=crawler.settings.getdict("CAPTCHA_SESSION_MAX_AGE")
+        )
+        spider.watermarks = WatermarkStore()
+        spider.search_complete = False
+        spider.store_failed = False
+        return spider
+
+    def checkpoint(self, stored=True):
+        """
+        Called by MetaDataPipeline after each flush. Once the last result page is
+        parsed and every flush stored its rows, the search is complete up to
+        to_date and the watermark moves there.
+        """
+        if not stored:
+            self.store_failed = True
+        elif self.search_complete and not self.store_failed:
+            self.watermarks.advance(COURT, self.crawl_through)
+
+    def start_requests(self):
+        today = datetime.today().date()
+        # from the watermark minus CRAWL_OVERLAP_DAYS, or the last DEFAULT_DAYS days
+        start = crawl_start(self.settings, self.watermarks.get(COURT), DEFAULT_DAYS, today)
+        self.logger.info(f"Crawling judgments from {start} to {today}")
+        self.from_date = start.strftime("%d-%m-%Y")
+        self.to_date = today.strftime("%d-%m-%Y")
+        self.crawl_through = today
+
+        session = self.sessions.get(COURT)
+        if session and self.sessions.reusable(COURT):
+            # Skip the form page: post straight away with the stored token/captcha
+            self.token = session["state"]["token"]
+            self.captcha = session["state"]["captcha"]
+            yield self.results_request(1, cookies=session["cookies"], reused=True)
+        else:
+            yield from super().start_requests()
+
     def parse(self,response):
 
         token = response.css('input[name="_token"]::attr(value)').get()
@@ -35,28 +87,48 @@ class DelhiJudgmentsSpider(scrapy.Spider):
 
         self.token = token
         self.captcha = captcha
-        today = datetime.today()
-        self.from_date = (today - timedelta(days=30)).strftime("%d-%m-%Y")
-        self.to_date = today.strftime("%d-%m-%Y")
+        self.sessions.store(
+            COURT,
+            cookies_from_headers(response.headers.getlist("Set-Cookie")),
+            token=token,
+            captcha=captcha,
+        )
 
-      
-        yield scrapy.FormRequest(
+        yield self.results_request(1)
+
+    def results_request(self, page, cookies=None, reused=False):
+        return scrapy.FormRequest(
             url=self.start_urls[0],
             method="POST",
             formdata={
-                "_token": token,
+                "_token": self.token,
                 "from_date": self.from_date,
                 "to_date": self.to_date,
-                "randomid": captcha,
-                "captchaInput": captcha,
-                "page": "1"
+                "randomid": self.captcha,
+                "captchaInput": self.captcha,
+                "page": str(page)
             },
+            cookies=cookies,
             callback=self.parse_results,
-            meta={"page": 1}
+            # 419 is Laravel's "page expired" (stale CSRF token)
+            meta={"page": page, "reused_session": reused, "handle_httpstatus_list": [419]},
+            dont_filter=True
         )
 
     def parse_results(self, response):
         soup = BeautifulSoup(response.text, "html.parser")
+        if response.status == 419 or not soup.select("#registrarsTableValue"):
+            if response.meta.get("reused_session"):
+                # Stored session expired: scrape a fresh token/captcha and start over
+                self.sessions.invalidate(COURT, f"(status {response.status})")
+                yield scrapy.Request(self.start_urls[0], callback=self.parse, dont_filter=True)
+                return
+            if response.status == 419:
+                self.logger.error("Delhi search rejected the form token (419)")
+                return
+        elif response.meta.get("reused_session") and response.meta["page"] == 1:
+            self.sessions.touch(COURT)
+
         rows = soup.select("#registrarsTableValue tr")[1:]  
 
         for row in rows:
@@ -96,6 +168,7 @@ class DelhiJudgmentsSpider(scrapy.Spider):
             }
 
       
+        total_pages = 1
         text = soup.find("div", string=re.compile("Showing"))
         if text:
             match = re.search(r"Showing \d+ to \d+ of (\d+)", text.get_text())
@@ -104,19 +177,13 @@ class DelhiJudgmentsSpider(scrapy.Spider):
                 per_page = 50
                 total_pages = math.ceil(total_records / per_page)
 
-                current_page = response.meta["page"]
-                if current_page < total_pages:
-                    yield scrapy.FormRequest(
-                        url=self.start_urls[0],
-                        method="POST",
-                        formdata={
-                            "_token": self.token,
-                            "from_date": self.from_date,
-                            "to_date": self.to_date,
-                            "randomid": self.captcha,
-                            "captchaInput": self.captcha,
-                            "page": str(current_page + 1)
-                        },
-                        callback=self.parse_results,
-                        meta={"page": current_page + 1}
-                    )
+        current_page = response.meta["page"]
+        if current_page < total_pages:
+            yield self.results_request(current_page + 1)
+        elif soup.select("#registrarsTableValue"):
+            # every page is parsed; complete once these rows are stored (checkpoint)
+            self.search_complete = True
+
+    def closed(self, reason):
+        self.sessions.save()
+        self.watermarks.close()
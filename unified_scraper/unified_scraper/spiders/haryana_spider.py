@@ -5,16 +5,13 @@ import base64
 import hashlib
 import os
 from dotenv import load_dotenv
+from unified_scraper.utils.run_manifest import RunManifest
+from unified_scraper.utils.watermarks import WatermarkStore, crawl_start, verified_through
 
 load_dotenv()
 
-XEvil_CONFIG = {
-    "baseUrl": os.getenv("BASE_URL_XEVIL"),
-    "key" : os.getenv("CAPTCHA_KEY"), 
-    "initialDelay": 5,
-    "interval": 5,
-    "retries": 6
-}
+COURT = "phhc"
+DEFAULT_DAYS = 60
 
 class PHHCCaseSpider(scrapy.Spider):
     custom_settings = {
@@ -27,14 +24,88 @@ class PHHCCaseSpider(scrapy.Spider):
 
     name = "phhc_case_form_dynamic"
     allowed_domains = ["phhc.gov.in"]
+
+    # used by MetaDataPipeline
+    high_court_name = "Punjab&Haryana High Court"
+    base_link = "https://www.phhc.gov.in/home.php?search_param=free_text_search_judgment"
+    pdf_folder = "phhc"
+
     start_url = os.getenv("HARYANA_START_URL")
 
-    def date_range_last_two_months(self):
-        today = datetime.datetime.today() 
-        two_months_ago = today - datetime.timedelta(days=60)
-        for n in range((today - two_months_ago).days):
-            day = two_months_ago + datetime.timedelta(days=n)
-            yield day.strftime('%d/%m/%Y')
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # crawling for a pipeline run (-a run_id=...): (case type, day) slices already
+        # stored in that run are skipped, and new ones are recorded as they finish
+        run_id = getattr(spider, "run_id", None)
+        spider.manifest = RunManifest(COURT, run_id=run_id) if run_id else None
+        spider.finished_slices = []
+        # each case type is crawled from its watermark; days stored so far, by case type
+        spider.watermarks = WatermarkStore()
+        spider.window_start = {}
+        spider.crawled_days = {}
+        # days the court answered "refine your query" for, by case type
+        spider.over_limit = {}
+        spider.store_failed = False
+        return spider
+
+    def finish_slice(self, case_type, day):
+        self.finished_slices.append((f"{case_type}|{day}", None))
+
+    def over_limit_slice(self, case_type, day):
+        """
+        The court listed too many results for this slice to crawl it in full. It is
+        not marked crawled in the run manifest, so a resumed run searches it again,
+        but it is recorded in the watermark store's over-limit list and does not
+        hold back the case type's watermark.
+        """
+        date = datetime.datetime.strptime(day, "%d-%m-%Y").date()
+        self.watermarks.mark_over_limit(COURT, date, case_type=case_type)
+        self.over_limit.setdefault(case_type, set()).add(date)
+        self.crawler.stats.inc_value(f"{COURT}/over_limit_days")
+
+    def checkpoint(self, stored=True):
+        """
+        Called by MetaDataPipeline after each flush: the slices finished before it
+        have all their rows in MetaData now (unless the flush failed). A case type's
+        watermark moves up to the last day of its window stored without a gap,
+        over-limit days (see over_limit_slice) not counting as gaps.
+        """
+        slices, self.finished_slices = self.finished_slices, []
+        if not stored:
+            self.store_failed = True
+        if not slices or not stored:
+            return
+        if self.manifest is not None:
+            self.manifest.mark_items("crawl", slices)
+        if self.store_failed:
+            return
+        case_types = set()
+        for key, _ in slices:
+            case_type, day = key.rsplit("|", 1)
+            self.crawled_days.setdefault(case_type, set()).add(datetime.datetime.strptime(day, "%d-%m-%Y").date())
+            case_types.add(case_type)
+        for case_type in case_types:
+            crawled = self.crawled_days[case_type]
+            stored_in_full = crawled & self.over_limit.get(case_type, set())
+            if stored_in_full:
+                self.watermarks.clear_over_limit(COURT, stored_in_full, case_type=case_type)
+                self.over_limit[case_type] -= stored_in_full
+            through = verified_through(self.window_start[case_type], crawled | self.over_limit.get(case_type, set()))
+            if through:
+                self.watermarks.advance(COURT, through, case_type=case_type)
+
+    def crawl_days(self, case_type):
+        """
+        Days to search for `case_type`, up to yesterday: from its watermark minus
+        CRAWL_OVERLAP_DAYS, or the last DEFAULT_DAYS days (see crawl_start).
+        """
+        today = datetime.date.today()
+        start = crawl_start(self.settings, self.watermarks.get(COURT, case_type=case_type), DEFAULT_DAYS, today)
+        self.window_start[case_type] = start
+        self.over_limit[case_type] = self.watermarks.over_limit_days(COURT, case_type=case_type)
+        for n in range((today - start).days):
+            yield start + datetime.timedelta(days=n)
 
     def start_requests(self):
         yield scrapy.Request(
@@ -48,9 +119,18 @@ class PHHCCaseSpider(scrapy.Spider):
         case_types = response.css('select[name="t_case_type"] option::attr(value)').getall()
         case_types = [ct for ct in case_types if ct.strip() != '']
         self.logger.info(f"Found {len(case_types)} case types: {case_types}")
+        done = self.manifest.done_keys("crawl") if self.manifest else set()
+        if done:
+            self.logger.info(f"Resuming run {self.manifest.run_id}: {len(done)} slices already crawled")
 
         for case_type in case_types:
-            for day in self.date_range_last_two_months():
+            days = list(self.crawl_days(case_type))
+            self.logger.info(f"Case type {case_type}: crawling {len(days)} days from {self.window_start[case_type]}")
+            for date in days:
+                day = date.strftime('%d/%m/%Y')
+                if f"{case_type}|{day.replace('/', '-')}" in done:
+                    self.crawled_days.setdefault(case_type, set()).add(date)
+                    continue
                 formdata = {
                     'from_date': day,
                     'to_date': day,
@@ -76,12 +156,16 @@ class PHHCCaseSpider(scrapy.Spider):
         new_date = date_obj.strftime("%Y-%m-%d")
         if b'refine your query' in response.body.lower():
             self.logger.warning(f"'Refine your query' found for case_type={case_type}, date={day}, url={response.url}")
+            # the results were cut off: not crawled, but listed apart so the watermark can pass it
+            self.over_limit_slice(case_type, day)
+            return
 
         table = response.css('table#tables11')
         headers = table.css('tr th::text').getall()
         rows = table.css('tr')[1:]
 
         if not rows:
+            self.finish_slice(case_type, day)
             return
         for row in rows:
             cells = row.css('td')
@@ -136,4 +220,11 @@ class PHHCCaseSpider(scrapy.Spider):
                 cb_kwargs={'case_type': case_type, 'day': day},
                 dont_filter=True
             )
+        else:
+            self.finish_slice(case_type, day)
+
+    def closed(self, reason):
+        self.watermarks.close()
+        if self.manifest is not None:
+            self.manifest.close()
     
\ No newline at end of file
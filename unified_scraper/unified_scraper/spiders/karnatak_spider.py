@@ -1,96 +1,133 @@
+import os
 import scrapy
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from unified_scraper.utils.captcha_resolver import XevilCaptchaSolver
+from unified_scraper.utils.captcha_resolver import build_solver_chain, save_captcha_fixture
+from unified_scraper.utils.captcha_pool import CaptchaPool, captcha_retry_budget, download_request
+from unified_scraper.utils.watermarks import WatermarkStore, crawl_start
 import json
 import urllib.parse
 from scrapy.downloadermiddlewares.cookies import CookiesMiddleware
 
+COURT = "karhc"
+DEFAULT_DAYS = 7
+
+
 class KarnatakaSpider(scrapy.Spider):
     name = "karnataka_spider"
     allowed_domains = ["hcservices.ecourts.gov.in"]
     start_urls = ["https://hcservices.ecourts.gov.in/hcservices/main.php"]
 
     custom_settings = {
-        "FEEDS": {
-            "results.csv": {
-                "format": "csv",
-                "overwrite": True,   # ensures CSV is replaced, not appended
-                "fields": ["bench", "case_no", "date", "document_link"],  # enforce columns
-            }
-        },
         "COOKIES_ENABLED": True,
     }
 
+    # used by MetaDataPipeline (each item carries its bench)
+    high_court_name = "Karnataka High Court"
+    base_link = "https://hcservices.ecourts.gov.in/hcservices/main.php"
+    pdf_folder = "karhc"
+
     benches = {
         "1": "Principal Bench at Bengaluru",
         "2": "Bench at Dharwad",
         "3": "Bench at Kalburagi",
     }
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.solver = build_solver_chain("karhc", crawler.stats)
+        # each bench is searched from its watermark; benches whose results are all buffered
+        spider.watermarks = WatermarkStore()
+        spider.searched_benches = []
+        spider.store_failed = False
+        return spider
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.solver = XevilCaptchaSolver()
         self.logger.setLevel(logging.INFO)
 
-        today = datetime.today()
-        self.from_date = (today - timedelta(days=7)).strftime("%d-%m-%Y")
-        self.to_date = today.strftime("%d-%m-%Y")
+        self.today = datetime.today().date()
+        self.from_dates = {}
+        self.to_date = self.today.strftime("%d-%m-%Y")
 
         self.state_code = "3"  # Karnataka state code
+        self.captcha_pool = None
+        self.bench_jars = {}
+
+    def get_captcha_pool(self):
+        if self.captcha_pool is None:
+            self.captcha_pool = CaptchaPool(
+                self.prepare_captcha_session,
+                self.solver,
+                size=self.settings.getint("CAPTCHA_POOL_SIZE", len(self.benches)),
+                jar_prefix="karhc",
+                # one search per bench; invalid-captcha retries re-solve in the bench's own jar
+                demand=len(self.benches),
+            )
+        return self.captcha_pool
 
-    def parse(self, response):
-        """Step 1: Request each bench (mimics fillHCBench call)."""
-        for bench_code, bench_name in self.benches.items():
-            payload = {
+    async def prepare_captcha_session(self, jar):
+        """Open a session in `jar` (mimics fillHCBench call) and fetch its captcha."""
+        await download_request(self.crawler, scrapy.FormRequest(
+            url="https://hcservices.ecourts.gov.in/hcservices/main.php",
+            formdata={
                 "action_code": "fillHCBench",
                 "state_code": self.state_code,
                 "appFlag": "web",
-            }
-
-            yield scrapy.FormRequest(
-                url="https://hcservices.ecourts.gov.in/hcservices/main.php",
-                formdata=payload,
-                callback=self.parse_bench_response,
-                meta={
-                    "cookiejar": bench_code,
-                    "bench_code": bench_code,
-                    "bench_name": bench_name,
-                },
-                dont_filter=True,
-            )
-
-    def parse_bench_response(self, response):
-        """Step 2: Fetch captcha."""
-        captcha_url = "https://hcservices.ecourts.gov.in/hcservices/securimage/securimage_show.php"
-        yield scrapy.Request(
-            captcha_url,
-            callback=self.solve_captcha,
-            meta=response.meta,
+            },
+            meta={"cookiejar": jar},
             dont_filter=True,
-        )
-
-    def solve_captcha(self, response):
-        """Step 3: Solve captcha and submit search form with date range."""
-        bench_name = response.meta["bench_name"]
-        captcha_text = self.solver.solve(response.body)
-
-        if not captcha_text:
-            self.logger.error(f"[{bench_name}] Captcha solving failed")
+        ))
+        captcha = await download_request(self.crawler, scrapy.Request(
+            "https://hcservices.ecourts.gov.in/hcservices/securimage/securimage_show.php",
+            meta={"cookiejar": jar},
+            dont_filter=True,
+        ))
+        return {"image": captcha.body}
+
+    def checkpoint(self, stored=True):
+        """
+        Called by MetaDataPipeline after each flush: the benches whose search was
+        complete before it have all their rows in MetaData, so their watermarks
+        move to today (unless a flush failed).
+        """
+        benches, self.searched_benches = self.searched_benches, []
+        if not stored:
+            self.store_failed = True
+        if self.store_failed:
             return
+        for bench_name in benches:
+            self.watermarks.advance(COURT, self.today, bench=bench_name)
 
-        self.logger.info(f"[{bench_name}] Captcha: {captcha_text}")
-
-        bench_code = response.meta["bench_code"]
-
+    async def parse(self, response):
+        """Step 1: Take a warm, solved session for each bench and submit the search."""
+        pool = self.get_captcha_pool()
+        budget = captcha_retry_budget(self.settings, "karhc")
+        for bench_code, bench_name in self.benches.items():
+            # from the watermark minus CRAWL_OVERLAP_DAYS, or the last DEFAULT_DAYS days
+            start = crawl_start(self.settings, self.watermarks.get(COURT, bench=bench_name), DEFAULT_DAYS, self.today)
+            self.from_dates[bench_code] = start.strftime("%d-%m-%Y")
+            self.logger.info(f"[{bench_name}] Searching orders from {start} to {self.today}")
+            entry, retries = await pool.acquire_with_retries(budget)
+            if not entry:
+                self.logger.error(f"[{bench_name}] Captcha solving failed")
+                continue
+
+            self.logger.info(f"[{bench_name}] Captcha: {entry['captcha']}")
+            self.bench_jars[bench_code] = entry["jar"]
+            yield self.search_request(entry, bench_code, bench_name, retries)
+
+    def search_request(self, entry, bench_code, bench_name, retries=0):
+        """Step 2: Submit search form with date range using a solved captcha."""
         formdata = {
             "court_code": bench_code,
             "state_code": self.state_code,
             "court_complex_code": bench_code,
             "caseStatusSearchType": "COorderDate",
-            "from_date": self.from_date,
+            "from_date": self.from_dates[bench_code],
             "to_date": self.to_date,
-            "captcha": captcha_text,
+            "captcha": entry["captcha"],
         }
 
         headers = {
@@ -101,13 +138,19 @@ class KarnatakaSpider(scrapy.Spider):
             "Referer": "https://hcservices.ecourts.gov.in/hcservices/main.php",
         }
 
-        yield scrapy.FormRequest(
+        return scrapy.FormRequest(
             url="https://hcservices.ecourts.gov.in/hcservices/cases_qry/index_qry.php?action_code=showRecords",
             formdata=formdata,
             headers=headers,
             method="POST",
             callback=self.parse_results,
-            meta=response.meta,
+            meta={
+                "cookiejar": entry["jar"],
+                "bench_code": bench_code,
+                "bench_name": bench_name,
+                "captcha_entry": entry,
+                "captcha_retries": retries,
+            },
             dont_filter=True,
         )
 
@@ -140,22 +183,46 @@ class KarnatakaSpider(scrapy.Spider):
         ]
         return f"{base}?{'&'.join([f'{k}={v}' for k, v in params if v])}"
 
-    def parse_results(self, response):
+    async def parse_results(self, response):
         bench_name = response.meta["bench_name"]
         bench_code = response.meta["bench_code"]
 
+        entry = response.meta["captcha_entry"]
+
         if "invalid captcha" in response.text.lower():
-            self.logger.error(f"[{bench_name}] Invalid captcha")
+            self.solver.report_result(entry["engine"], False)
+            used = response.meta["captcha_retries"]
+            budget = captcha_retry_budget(self.settings, "karhc")
+            if used >= budget:
+                self.solver.stats.inc("gave_up")
+                self.logger.error(f"[{bench_name}] Invalid captcha, giving up after {used} retries")
+                return
+
+            # Re-solve in the same jar; the rejected engine's answer is not trusted again
+            self.logger.warning(f"[{bench_name}] Invalid captcha, retrying ({used + 1}/{budget})")
+            self.solver.stats.inc("retries")
+            retry_entry, extra = await self.get_captcha_pool().acquire_with_retries(
+                budget - used - 1, jar=entry["jar"], skip=("local",)
+            )
+            if retry_entry:
+                yield self.search_request(retry_entry, bench_code, bench_name, used + 1 + extra)
             return
 
+        self.solver.report_result(entry["engine"], True)
+
         try:
             data = json.loads(response.text)
         except json.JSONDecodeError:
             self.logger.error(f"[{bench_name}] Not JSON response: {response.text[:200]}")
             return
 
+        save_captcha_fixture(entry["image"], entry["captcha"], "karhc")
+        # the pipeline downloads this bench's PDFs while the others are still crawled
+        self.save_cookies()
+
         if not data.get("con"):
             self.logger.warning(f"[{bench_name}] No records found")
+            self.searched_benches.append(bench_name)
             return
 
         records = json.loads(data["con"][0])
@@ -176,8 +243,18 @@ class KarnatakaSpider(scrapy.Spider):
                 "pdf_link": pdf_link or "",
             }
 
+        self.searched_benches.append(bench_name)
+
     def closed(self, reason):
         """Save cookies to a file when spider finishes."""
+        if self.captcha_pool:
+            self.captcha_pool.close()
+        self.solver.close()
+        self.watermarks.close()
+        self.save_cookies()
+
+    def save_cookies(self):
+        """Write the session cookies of every bench searched so far to cookies.json."""
         cookies = {}
 
         # find the cookies middleware object in the stack
@@ -191,13 +268,15 @@ class KarnatakaSpider(scrapy.Spider):
             self.logger.error("❌ CookiesMiddleware not found")
             return
 
-        # extract cookies per bench_code
-        for bench_code in self.benches.keys():
-            cj = cookies_mw.jars.get(str(bench_code))
+        # extract cookies per bench_code from the jar its search ran in
+        for bench_code, jar in self.bench_jars.items():
+            cj = cookies_mw.jars.get(jar)
             if cj:
                 cookies[bench_code] = {c.name: c.value for c in cj}
 
-        with open("cookies.json", "w") as f:
+        # replaced in one step, the downloader may be reading it
+        with open("cookies.json.tmp", "w") as f:
             json.dump(cookies, f, indent=2)
+        os.replace("cookies.json.tmp", "cookies.json")
 
         self.logger.info("✅ Cookies saved to cookies.json")
\ No newline at end of file
@@ -1,18 +1,16 @@
-import re, time, requests, base64, hashlib, os, scrapy, datetime, pandas as pd
-from pdf2image import convert_from_bytes
-import pytesseract
+import re, asyncio, requests, hashlib, os, scrapy, datetime, pandas as pd
+from functools import partial
 from Database.high_court_database import SessionLocal
-from unified_scraper.utils.pdf_downloader import get_pending_pdfs
+from unified_scraper.utils.pdf_downloader import iter_new_pending_pdfs, mark_download_failed
+from unified_scraper.utils.captcha_resolver import build_solver_chain, save_captcha_fixture
+from unified_scraper.utils.captcha_pool import captcha_retry_budget
+from unified_scraper.utils.session_manager import CaptchaSessionManager
+from unified_scraper.utils.text_extraction import TextExtractionStage, extract_text, txt_path_for
+from unified_scraper.utils.run_manifest import RunManifest
+from unified_scraper.utils.document_stream import STREAM_CONFIG
+from urllib.parse import urljoin
 
-XEvil_CONFIG = {
-    "baseUrl": "http://98.70.40.179/",
-    "key": os.getenv("CAPTCHA_KEY"),
-    "initialDelay": 5,
-    "interval": 5,
-    "retries": 6
-}
-
-SUCCESSFUL_PDFS = []
+COURT = "phhc"
 
 class PHHCCaseSpider(scrapy.Spider):
     name = "general"
@@ -26,143 +24,249 @@ class PHHCCaseSpider(scrapy.Spider):
         'REDIRECT_ENABLED': False,
     }
 
-    def __init__(self, *args, **kwargs):
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.solver = build_solver_chain("phhc", crawler.stats)
+        spider.sessions = CaptchaSessionManager(
+            crawler_stats=crawler.stats, max_ages=crawler.settings.getdict("CAPTCHA_SESSION_MAX_AGE")
+        )
+        spider.text_stage = TextExtractionStage(
+            workers=crawler.settings.getint("OCR_WORKERS", 0),
+            extractor=partial(extract_text, ocr=True),
+            max_pending=crawler.settings.getint("OCR_QUEUE_SIZE", 16),
+        )
+        # saved PDFs are recorded in the pipeline run's manifest (-a run_id=...),
+        # which is what the upload step reads and what a rerun resumes from
+        run_id = getattr(spider, "run_id", None)
+        spider.manifest = RunManifest(COURT, run_id=run_id) if run_id else None
+        return spider
+
+    def __init__(self, *args, crawling=None, uploads=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.downloaded_count = 0
-        self.last_success_row = -1
-        
+        self.session_lock = asyncio.Lock()
+        self.http = None
+        # run in-process by the pipeline: while `crawling()` the listing spider is still
+        # inserting documents, which are picked up as they appear, and saved PDFs go
+        # to the `uploads` stage (an UploadStage) in batches instead of waiting for the end
+        self.crawling = crawling or (lambda: False)
+        self.uploads = uploads
+        self.upload_batch = []
+        self.upload_futures = []
+
+    def resume_downloads(self):
+        """
+        Document ids this run already saved a PDF for. Their downloads are not
+        repeated but they are queued for upload; a PDF whose TXT never got
+        written is queued for extraction again.
+        """
+        if self.manifest is None:
+            return set()
+        done = set()
+        for key, item in self.manifest.items("download").items():
+            if not os.path.exists(item["pdf_path"]):
+                continue
+            done.add(key)
+            future = None
+            if not os.path.exists(txt_path_for(item["pdf_path"])):
+                future = self.text_stage.submit(item["pdf_path"])
+            self.queue_upload(item, future)
+        if done:
+            self.logger.info(f"Resuming run {self.manifest.run_id}: {len(done)} PDFs already downloaded")
+        return done
 
-    def start_requests(self):
+    async def start(self):
         session = SessionLocal()
 
         try:
-            
-            pending_pdfs = get_pending_pdfs(session, high_court_name="Punjab&Haryana High Court",bench_name=None)
-            
-            start_index = int(getattr(self, 'start_index', 0))
-
-            for index, record in enumerate(pending_pdfs[start_index:], start=start_index):
-                
-                yield scrapy.Request(
-                    url=record["document_link"],  
-                    callback=self.solve_and_download_pdf,
-                    cb_kwargs={
-                        "link": record["document_link"],
-                        "row_index": index,
-                        "case_id": record["case_id"],
-                        "db_id": record["id"] 
-                    },
-                    dont_filter=True
-                )
+            done = self.resume_downloads()
+            await self.flush_uploads()
+            seen = {int(key) for key in done}
+            index = 0
+            while True:
+                finished = not self.crawling()
+                found = False
+                for batch in iter_new_pending_pdfs(session, "Punjab&Haryana High Court", None, seen):
+                    found = True
+                    for record in batch:
+                        # Send the warm verified session (if any) so the PDF may come back without a captcha
+                        reuse = self.sessions.reusable(COURT)
+                        yield scrapy.Request(
+                            url=record.document_link,
+                            callback=self.solve_and_download_pdf,
+                            headers=self.sessions.cookie_header(COURT) if reuse else {},
+                            meta={"dont_merge_cookies": reuse},
+                            cb_kwargs={
+                                "link": record.document_link,
+                                "row_index": index,
+                                "case_id": record.case_id,
+                                "db_id": record.id,
+                                "document_id": record.document_id,
+                                "session_version": self.sessions.version(COURT),
+                            },
+                            dont_filter=True
+                        )
+                        index += 1
+                if finished:
+                    break
+                if not found:
+                    await asyncio.sleep(STREAM_CONFIG["pollSeconds"])
         finally:
             session.close()
 
-    def solve_and_download_pdf(self, response, link, row_index,case_id,db_id):
-        from urllib.parse import urljoin
+    def new_http_session(self, referer):
+        session = requests.Session()
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0',
+            'Referer': referer,
+            'Origin': 'https://www.phhc.gov.in',
+            'Content-Type': 'application/x-www-form-urlencoded',
+        })
+        return session
+
+    async def solve_and_download_pdf(self, response, link, row_index,case_id,db_id,document_id=None,session_version=0):
         print("downloading start")
 
-        form_action = response.xpath('//form[@id="security_chaeck"]/@action').get()
-        captcha_src = response.css('img#captchaimg::attr(src)').get()
+        if response.headers.get("Content-Type", b"").startswith(b"application/pdf"):
+            self.sessions.touch(COURT)
+            pdf_bytes = response.body
+        elif self.sessions.reusable(COURT):
+            pdf_bytes = await self.download_with_shared_session(response, link, row_index, session_version)
+        else:
+            session = self.new_http_session(response.url)
+            pdf_bytes = await self.submit_captcha(session, response.url, response.text, link, row_index)
+
+        if not pdf_bytes:
+            session = SessionLocal()
+            try:
+                mark_download_failed(session, document_id)
+            finally:
+                session.close()
+            return
+
+        auth_token = link.split('auth=')[-1]
+        file_path, future = await self.save_pdf_and_txt(pdf_bytes, auth_token, row_index)
+        if not file_path:
+            return
+        self.downloaded_count += 1
+        item = {
+            "pdf_path": file_path,
+            "case_id": case_id,
+            "id": db_id,
+            "document_id": document_id,
+        }
+        if self.manifest is not None:
+            self.manifest.mark_item("download", document_id, item)
+        self.queue_upload(item, future)
+        if len(self.upload_batch) >= STREAM_CONFIG["batchSize"]:
+            await self.flush_uploads()
+
+    def queue_upload(self, item, future=None):
+        if self.uploads is not None:
+            self.upload_batch.append(item)
+            if future is not None:
+                self.upload_futures.append(future)
+
+    async def flush_uploads(self):
+        """Hand the PDFs saved so far to the upload stage; waits (off the loop) while it is full."""
+        batch, self.upload_batch = self.upload_batch, []
+        futures, self.upload_futures = self.upload_futures, []
+        if batch:
+            await self.uploads.put_async(batch, futures, self.text_stage)
+
+    async def download_with_shared_session(self, response, link, row_index, session_version):
+        """
+        The captcha form came back, so the session this request carried is not (or no
+        longer) verified. One callback at a time re-verifies the shared session; the
+        others wait for that, then retry with it side by side, outside the lock.
+        """
+        page_url, page_text = response.url, response.text
+        while True:
+            async with self.session_lock:
+                if self.http is None:
+                    self.http = self.new_http_session(response.url)
+                    self.http.cookies.update(self.sessions.cookies(COURT))
+
+                if self.sessions.version(COURT) == session_version:
+                    self.sessions.invalidate(COURT, "(captcha form returned)")
+                    pdf_bytes = await self.submit_captcha(self.http, page_url, page_text, link, row_index)
+                    if pdf_bytes:
+                        self.sessions.store(COURT, self.http.cookies.get_dict())
+                    return pdf_bytes
+                session_version = self.sessions.version(COURT)
+
+            # Re-verified while this request was in flight, try again with it
+            page = await asyncio.to_thread(self.http.get, link)
+            if page.headers.get("Content-Type", "").startswith("application/pdf"):
+                self.sessions.touch(COURT)
+                return page.content
+            page_url, page_text = page.url, page.text
+
+    async def submit_captcha(self, session, page_url, page_text, link, row_index):
+        """Solve the captcha form on `page_text` in `session`; returns the PDF bytes or None."""
+        page = scrapy.Selector(text=page_text)
+        form_action = page.xpath('//form[@id="security_chaeck"]/@action').get()
+        captcha_src = page.css('img#captchaimg::attr(src)').get()
 
         if not form_action or not captcha_src:
             self.logger.error(f"[Row {row_index}] Could not extract CAPTCHA form or image.")
-            return
+            return None
 
-        full_post_url = response.urljoin(form_action)
-        captcha_url = response.urljoin(captcha_src)
+        full_post_url = urljoin(page_url, form_action)
+        captcha_url = urljoin(page_url, captcha_src)
 
-        session = requests.Session()
-        for name, value in response.request.cookies.items():
-            session.cookies.set(name, value)
+        budget = captcha_retry_budget(self.settings, "phhc")
+        skip = ()
+        for attempt in range(budget + 1):
+            if attempt:
+                self.solver.stats.inc("retries")
+                self.logger.warning(f"[Row {row_index}] Retrying CAPTCHA ({attempt}/{budget})")
 
-        headers = {
-            'User-Agent': 'Mozilla/5.0',
-            'Referer': response.url,
-            'Origin': 'https://www.phhc.gov.in',
-            'Content-Type': 'application/x-www-form-urlencoded',
-        }
-        session.headers.update(headers)
+            # A new image in the same session replaces the previous captcha
+            try:
+                captcha_response = await asyncio.to_thread(session.get, captcha_url)
+                captcha_bytes = captcha_response.content
+            except Exception as e:
+                self.logger.error(f"[Row {row_index}] Failed to download CAPTCHA image: {e}")
+                continue
 
-        try:
-            captcha_response = session.get(captcha_url)
-            captcha_bytes = captcha_response.content
-        except Exception as e:
-            self.logger.error(f"[Row {row_index}] Failed to download CAPTCHA image: {e}")
-            return
-        
-        captcha_text = self.solve_captcha_xevil(captcha_bytes)
-        if not captcha_text:
-            self.logger.error(f"[Row {row_index}] CAPTCHA solving failed for {link}")
-            return
-        print(f"captcha_text{captcha_text}")
-        payload = {'vercode': captcha_text, 'submit': 'Submit'}
+            captcha_text, engine = await self.solver.solve_with_engine_async(captcha_bytes, skip=skip)
+            if not captcha_text:
+                self.logger.error(f"[Row {row_index}] CAPTCHA solving failed for {link}")
+                continue
+            print(f"captcha_text{captcha_text}")
+            payload = {'vercode': captcha_text, 'submit': 'Submit'}
 
-        try:
-            post_response = session.post(full_post_url, data=payload, allow_redirects=True)
-        except Exception as e:
-            self.logger.error(f"[Row {row_index}] POST request failed: {e}")
-            return
+            try:
+                post_response = await asyncio.to_thread(session.post, full_post_url, data=payload, allow_redirects=True)
+            except Exception as e:
+                self.logger.error(f"[Row {row_index}] POST request failed: {e}")
+                continue
 
-        content_type = post_response.headers.get("Content-Type", "")
-        if content_type.startswith("application/pdf"):
-            auth_token = link.split('auth=')[-1]
-            file_path=self.save_pdf_and_txt(post_response.content, auth_token, row_index)
-            self.downloaded_count += 1
-            self.last_success_row = max(self.last_success_row, row_index)
-            SUCCESSFUL_PDFS.append({
-                "pdf_path": file_path,
-                "case_id": case_id,
-                "id": db_id
-            })
-            print(SUCCESSFUL_PDFS)
+            content_type = post_response.headers.get("Content-Type", "")
+            if content_type.startswith("application/pdf"):
+                self.solver.report_result(engine, True)
+                save_captcha_fixture(captcha_bytes, captcha_text, "phhc")
+                return post_response.content
 
-        else:
             # debug_file = "captcha_failed_response.html"
             # with open(debug_file, "w", encoding="utf-8") as f:
             #     f.write(post_response.text)
+            self.solver.report_result(engine, False)
             self.logger.warning(f"[Row {row_index}] CAPTCHA failed. ")
+            skip = ("local",)
 
-    def solve_captcha_xevil(self, captcha_bytes):
-        try:
-            base64_image = base64.b64encode(captcha_bytes).decode('utf-8')
-            submit = requests.post(
-                XEvil_CONFIG["baseUrl"] + "in.php",
-                data={
-                    "key": XEvil_CONFIG["key"],
-                    "method": "base64",
-                    "body": base64_image
-                }
-            )
-            if "OK|" not in submit.text:
-                self.logger.warning("Failed to submit CAPTCHA to XEvil")
-                return
-
-            captcha_id = submit.text.split("|")[1]
-            time.sleep(XEvil_CONFIG["initialDelay"])
-
-            for _ in range(XEvil_CONFIG["retries"]):
-                poll = requests.get(
-                    XEvil_CONFIG["baseUrl"] + "res.php",
-                    params={
-                        "key": XEvil_CONFIG["key"],
-                        "action": "get",
-                        "id": captcha_id
-                    }
-                )
-                if "OK|" in poll.text:
-                    captcha_text = poll.text.split("|")[1]
-                    self.logger.info(f" CAPTCHA Solved: {captcha_text}")
-                    return captcha_text
-                time.sleep(XEvil_CONFIG["interval"])
-
-            self.logger.warning("CAPTCHA solving timed out.")
-            return
+        self.solver.stats.inc("gave_up")
+        self.logger.error(f"[Row {row_index}] Giving up on {link} after {budget} CAPTCHA retries")
+        return None
 
-        except Exception as e:
-            self.logger.error(f"CAPTCHA solving failed: {str(e)}")
-            return
-
-    def save_pdf_and_txt(self, pdf_bytes, auth_token, row_index):
+    async def save_pdf_and_txt(self, pdf_bytes, auth_token, row_index):
+        """
+        Save the PDF and queue its text extraction (text layer first, OCR where
+        needed) on the background pool; the TXT lands next to the PDF. Only waits
+        when OCR_QUEUE_SIZE PDFs are already queued. Returns (PDF path, extraction future).
+        """
         try:
             # Create hash-based filename
             filename_hash = hashlib.md5(auth_token.encode()).hexdigest()
@@ -179,34 +283,31 @@ class PHHCCaseSpider(scrapy.Spider):
 
             # Define file paths
             pdf_path = os.path.join(dir_path, f"{filename_hash}.pdf")
-            txt_path = os.path.join(dir_path, f"{filename_hash}.txt")
 
             # Save the PDF file
             with open(pdf_path, "wb") as f:
                 f.write(pdf_bytes)
 
-            # Convert PDF pages to images and extract text using OCR
-            extracted_text = ""
-            try:
-                images = convert_from_bytes(pdf_bytes, dpi=300)
-                for i, img in enumerate(images):
-                    text = pytesseract.image_to_string(img)
-                    extracted_text += text + "\n"
-            except Exception as img_err:
-                self.logger.error(f"[Row {row_index}] OCR failed: {img_err}")
-                extracted_text = "[OCR FAILED]"
-
-            # Save extracted text to TXT file
-            with open(txt_path, 'w', encoding='utf-8') as f:
-                f.write(extracted_text)
-
-            self.logger.info(f" Row {row_index}: PDF saved at {pdf_path}")
-            self.logger.info(f" Row {row_index}: TXT saved at {txt_path}")
-            return pdf_path
+            future = await self.text_stage.submit_async(pdf_path)
+
+            self.logger.info(f" Row {row_index}: PDF saved at {pdf_path}, text extraction queued")
+            return pdf_path, future
 
         except Exception as e:
             self.logger.error(f"[Row {row_index}] Failed during PDF/TXT save: {e}")
+            return None, None
+
     def closed(self, reason):
+        self.solver.close()
+        self.sessions.save()
+        if self.upload_batch:
+            self.uploads.put(self.upload_batch, self.upload_futures, self.text_stage)
+        # the upload step reads the TXT files, so let the OCR backlog finish
+        self.text_stage.close()
+        failed = [r["pdf_path"] for r in self.text_stage.results if r["error"]]
+        if failed:
+            self.logger.error(f" Text extraction failed for {len(failed)} PDFs: {failed}")
         self.logger.info("\n Crawl completed.")
         self.logger.info(f" Total PDFs downloaded: {self.downloaded_count}")
-        self.logger.info(f" Last successfully downloaded row index: {self.last_success_row}")
+        if self.manifest is not None:
+            self.manifest.close()
@@ -1,18 +1,12 @@
+import re
 import scrapy
 from scrapy.http import FormRequest
 from datetime import datetime, timedelta
-import base64
-import time
-import requests
+from unified_scraper.utils.captcha_resolver import build_solver_chain, XEvil_CONFIG
+from unified_scraper.utils.captcha_pool import CaptchaPool, captcha_retry_budget, download_request
+from unified_scraper.utils.session_manager import CaptchaSessionManager
 
-
-XEvil_CONFIG = {
-    "baseUrl": "http://98.70.40.179/",
-    "key": "anykey",  
-    "initialDelay": 5,
-    "interval": 5,
-    "retries": 6
-}
+COURT = "bombay"
 
 
 class BombayJudgmentSpider(scrapy.Spider):
@@ -29,7 +23,54 @@ class BombayJudgmentSpider(scrapy.Spider):
         },
     }
 
-    def start_requests(self):
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.solver = build_solver_chain(
+            "bombay", crawler.stats, xevil_config={**XEvil_CONFIG, "key": "anykey"}
+        )
+        spider.sessions = CaptchaSessionManager(
+            crawler_stats=crawler.stats, max_ages=crawler.settings.getdict("CAPTCHA_SESSION_MAX_AGE")
+        )
+        return spider
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.captcha_pool = None
+
+    def get_captcha_pool(self):
+        if self.captcha_pool is None:
+            self.captcha_pool = CaptchaPool(
+                self.prepare_captcha_session,
+                self.solver,
+                size=self.settings.getint("CAPTCHA_POOL_SIZE", 4),
+                jar_prefix="bombay",
+            )
+        return self.captcha_pool
+
+    async def prepare_captcha_session(self, jar):
+        """Load the search form in `jar`, keep its CSRF pair and fetch the captcha."""
+        response = await download_request(self.crawler, scrapy.Request(
+            url=self.start_urls[0],
+            meta={"cookiejar": jar},
+            dont_filter=True
+        ))
+        captcha_src = response.xpath('//img[@id="captchaimg"]/@src').get()
+        if not captcha_src:
+            return None
+
+        captcha = await download_request(self.crawler, scrapy.Request(
+            url=response.urljoin(captcha_src),
+            meta={"cookiejar": jar},
+            dont_filter=True
+        ))
+        return {
+            "image": captcha.body,
+            "csrf_name": response.xpath('//input[@name="CSRFName"]/@value').get(),
+            "csrf_token": response.xpath('//input[@name="CSRFToken"]/@value').get(),
+        }
+
+    async def start(self):
         today = datetime.today()
         days_range = 1
         categories = ['C', 'CR', 'OS', 'NC', 'NR', 'AC', 'AR', 'GC', 'GR']
@@ -39,103 +80,112 @@ class BombayJudgmentSpider(scrapy.Spider):
                 target_date = today - timedelta(days=day_offset)
                 date_str = target_date.strftime("%d-%m-%Y")
 
-                yield scrapy.Request(
-                    url=self.start_urls[0],
-                    callback=self.parse_main,
-                    meta={
-                        "m_sideflg": bench,
-                        "frmdate": date_str,
-                        "todate": date_str,
-                        "pageno": 1
-                    },
-                    dont_filter=True
-                )
-
-    def parse_main(self, response):
-        csrf_name = response.xpath('//input[@name="CSRFName"]/@value').get()
-        csrf_token = response.xpath('//input[@name="CSRFToken"]/@value').get()
-        captcha_url = response.urljoin(response.xpath('//img[@id="captchaimg"]/@src').get())
-
-        yield scrapy.Request(
-            url=captcha_url,
-            callback=self.solve_and_submit,
-            meta=response.meta | {
-                "csrf_name": csrf_name,
-                "csrf_token": csrf_token,
-            },
-            dont_filter=True
+                request = await self.search_request({
+                    "m_sideflg": bench,
+                    "frmdate": date_str,
+                    "todate": date_str,
+                    "pageno": 1
+                })
+                if request:
+                    yield request
+
+    async def search_request(self, meta, jar=None, skip=()):
+        """
+        Build the search POST for one category/page from a pre-solved captcha session.
+        With `jar`, a fresh captcha is solved in that session instead (resubmission).
+        """
+        retries = meta.get("captcha_retries", 0)
+        budget = captcha_retry_budget(self.settings, "bombay")
+        entry, used = await self.get_captcha_pool().acquire_with_retries(
+            max(budget - retries, 0), jar=jar, skip=skip
         )
+        if not entry:
+            self.logger.warning(f"CAPTCHA solving failed for {meta['m_sideflg']} page {meta['pageno']}, giving up.")
+            return None
 
-    def solve_and_submit(self, response):
-        captcha_bytes = response.body
-        base64_image = base64.b64encode(captcha_bytes).decode('utf-8')
-
-        # Send CAPTCHA to XEvil API
-        try:
-            submit = requests.post(
-                XEvil_CONFIG["baseUrl"] + "in.php",
-                data={
-                    "key": XEvil_CONFIG["key"],
-                    "method": "base64",
-                    "body": base64_image
-                }
-            )
-
-            if "OK|" not in submit.text:
-                self.logger.warning("Failed to submit CAPTCHA to XEvil")
-                return
-
-            captcha_id = submit.text.split("|")[1]
-            time.sleep(XEvil_CONFIG["initialDelay"])
-
-            # Poll for solved CAPTCHA
-            captcha_text = None
-            for _ in range(XEvil_CONFIG["retries"]):
-                poll = requests.get(
-                    XEvil_CONFIG["baseUrl"] + "res.php",
-                    params={
-                        "key": XEvil_CONFIG["key"],
-                        "action": "get",
-                        "id": captcha_id
-                    }
-                )
-                if "OK|" in poll.text:
-                    captcha_text = poll.text.split("|")[1]
-                    break
-                time.sleep(XEvil_CONFIG["interval"])
-
-            if not captcha_text:
-                self.logger.warning("CAPTCHA solving timed out.")
-                return
-
-        except Exception as e:
-            self.logger.error(f"CAPTCHA solving failed: {str(e)}")
-            return
+        return self.form_request(meta | {"captcha_retries": retries + used}, entry)
 
+    def form_request(self, meta, entry, session_uses=None):
+        """
+        POST the search form with a solved captcha session. `session_uses` counts
+        the reuses (this one included) when a session is reused for another page.
+        """
         formdata = {
-            "CSRFName": response.meta["csrf_name"],
-            "CSRFToken": response.meta["csrf_token"],
-            "pageno": str(response.meta["pageno"]),
+            "CSRFName": entry["csrf_name"],
+            "CSRFToken": entry["csrf_token"],
+            "pageno": str(meta["pageno"]),
             "frmaction": "",
-            "m_sideflg": response.meta["m_sideflg"],
+            "m_sideflg": meta["m_sideflg"],
             "actcode": "0",
-            "frmdate": response.meta["frmdate"],
-            "todate": response.meta["todate"],
+            "frmdate": meta["frmdate"],
+            "todate": meta["todate"],
             "captchaflg": "",
-            "captcha_code": captcha_text,
+            "captcha_code": entry["captcha"],
             "submit1": "Submit"
         }
 
-        yield FormRequest(
+        return FormRequest(
             url=self.start_urls[0],
             formdata=formdata,
             callback=self.parse_results,
-            meta=response.meta,
+            meta=meta | {
+                "cookiejar": entry["jar"],
+                "captcha_entry": entry,
+                "session_uses": session_uses,
+            },
             dont_filter=True
         )
 
-    def parse_results(self, response):
+    def captcha_rejected(self, response):
+        return bool(re.search(
+            r"(invalid|incorrect|wrong)[^<]{0,40}captcha|captcha[^<]{0,40}(invalid|incorrect|wrong|not match)",
+            response.text,
+            re.IGNORECASE,
+        ))
+
+    async def parse_results(self, response):
+        search = {key: response.meta[key] for key in ("m_sideflg", "frmdate", "todate", "pageno")}
+        entry = response.meta["captcha_entry"]
+        retries = response.meta.get("captcha_retries", 0)
+        session_uses = response.meta["session_uses"]
         rows = response.xpath('//div[@class="table-responsive"]//tr[position()>1]')
+
+        if session_uses is not None and (not rows or self.captcha_rejected(response)):
+            # The reused session may have expired (or this is simply the last page):
+            # ask again with a fresh captcha in the same jar before concluding.
+            if self.captcha_rejected(response):
+                self.sessions.report_reuse(COURT, False, session_uses - 1)
+            request = await self.search_request(
+                search | {"reuse_check": session_uses - 1}, jar=entry["jar"], skip=("local",)
+            )
+            if request:
+                yield request
+            return
+
+        if "reuse_check" in response.meta and rows:
+            # Fresh captcha found rows the reused session did not: reuse is not reliable
+            self.sessions.report_reuse(COURT, False, response.meta["reuse_check"])
+        elif session_uses is not None:
+            self.sessions.report_reuse(COURT, True)
+
+        if self.captcha_rejected(response):
+            self.solver.report_result(entry["engine"], False)
+            if retries >= captcha_retry_budget(self.settings, "bombay"):
+                self.solver.stats.inc("gave_up")
+                self.logger.error(f"Invalid CAPTCHA for {search['m_sideflg']} page {search['pageno']}, giving up.")
+                return
+
+            self.solver.stats.inc("retries")
+            request = await self.search_request(
+                search | {"captcha_retries": retries + 1}, jar=entry["jar"], skip=("local",)
+            )
+            if request:
+                yield request
+            return
+
+        if session_uses is None:
+            self.solver.report_result(entry["engine"], True)
+
         if not rows:
             return
 
@@ -157,11 +207,18 @@ class BombayJudgmentSpider(scrapy.Spider):
                 "page": response.meta["pageno"]
             }
 
-        # Pagination
-        next_page = response.meta["pageno"] + 1
-        yield scrapy.Request(
-            url=self.start_urls[0],
-            callback=self.parse_main,
-            meta=response.meta | {"pageno": next_page},
-            dont_filter=True
-        )
\ No newline at end of file
+        # Pagination: keep using this session while the court accepts it
+        next_search = search | {"pageno": search["pageno"] + 1}
+        if self.sessions.reusable(COURT):
+            yield self.form_request(next_search, entry, session_uses=(session_uses or 0) + 1)
+            return
+
+        request = await self.search_request(next_search)
+        if request:
+            yield request
+
+    def closed(self, reason):
+        if self.captcha_pool:
+            self.captcha_pool.close()
+        self.solver.close()
+        self.sessions.save()
@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+import uuid
+import hashlib
+import logging
+import tempfile
+from collections import namedtuple
+from urllib.parse import urlsplit
+import aiohttp
+
+DOWNLOAD_CONFIG = {
+    "perHost": int(os.getenv("DOWNLOAD_CONCURRENCY_PER_HOST", "6")),
+    "total": int(os.getenv("DOWNLOAD_CONCURRENCY", "24")),
+    "timeout": 120,
+    "connectTimeout": 15,
+    "retries": 2,
+    "retryDelay": 2,
+    "progressEvery": 50,
+    "chunkSize": 64 * 1024,
+    # zero-disk mode: keep PDFs in memory, spilling to the system temp dir past spoolMaxBytes
+    "inMemory": os.getenv("ZERO_DISK") == "1",
+    "spoolMaxBytes": int(os.getenv("SPOOL_MAX_BYTES", str(16 * 1024 * 1024))),
+}
+
+# Readers accept the header and the trailer anywhere within the first / last KB
+PDF_MAGIC = b"%PDF-"
+PDF_TRAILER = b"%%EOF"
+PDF_SCAN_WINDOW = 1024
+
+# `buffer` is the PDF in zero-disk mode (then `path` is only its logical name)
+DownloadResult = namedtuple("DownloadResult", "item path sha256 size error buffer", defaults=(None,))
+
+
+class InvalidPdfError(ValueError):
+    """The server answered, but not with a complete PDF (error page, truncated body)."""
+
+
+def check_pdf(head, tail, size):
+    if not size:
+        raise InvalidPdfError("empty response")
+    if PDF_MAGIC not in head:
+        raise InvalidPdfError(f"no %PDF header, starts with {head[:40]!r}")
+    if PDF_TRAILER not in tail:
+        raise InvalidPdfError("no %%EOF trailer, download looks truncated")
+
+
+class DownloadStats:
+    """Counters for one download run, logged every `progressEvery` finished documents."""
+
+    def __init__(self, total, progress_every=50):
+        self.total = total
+        self.progress_every = progress_every
+        self.ok = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def done(self):
+        return self.ok + self.failed
+
+    def record(self, ok, size=0):
+        if ok:
+            self.ok += 1
+            self.bytes += size
+        else:
+            self.failed += 1
+        if self.done % self.progress_every == 0 or self.done == self.total:
+            self.log()
+
+    def log(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.logger.info(
+            f"Downloaded {self.done}/{self.total} ({self.ok} ok, {self.failed} failed, {self.retries} retries) "
+            f"{self.bytes / 1e6:.1f} MB in {elapsed:.0f}s, {self.done / elapsed:.1f} docs/s"
+        )
+
+    def summary(self):
+        return {
+            "total": self.total,
+            "ok": self.ok,
+            "failed": self.failed,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "seconds": round(time.monotonic() - self.started, 1),
+        }
+
+
+class AsyncPdfDownloader:
+    """
+    Downloads many documents over one pooled aiohttp session: connections are kept
+    alive and reused, at most `perHost` requests run against any one court server
+    and `total` overall. Per-request cookies let Karnataka send the jar of the
+    bench a link was issued to.
+
+    Each URL is fetched once: jobs repeating a URL share the first job's file.
+    Passing the same `seen_urls` dict to every batch extends that to a whole run.
+
+    With `inMemory` nothing is written next to `file_path`: each PDF goes into a
+    SpooledTemporaryFile that only spills to the temp dir above `spoolMaxBytes`.
+    """
+
+    def __init__(self, config=DOWNLOAD_CONFIG, headers=None, seen_urls=None):
+        self.config = {**DOWNLOAD_CONFIG, **config}
+        self.headers = headers or {"User-Agent": "Mozilla/5.0"}
+        self.seen_urls = {} if seen_urls is None else seen_urls
+        self.logger = logging.getLogger(__name__)
+        self._host_limits = {}
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.config["perHost"])
+        return self._host_limits[host]
+
+    async def fetch(self, session, url, file_path, cookies=None, require_pdf_type=False):
+        """
+        Stream `url` to a unique temp file next to `file_path` in `chunkSize` chunks, hashing
+        as the data arrives, and rename it into place only if it is a complete PDF.
+        In zero-disk mode the data goes to a spooled buffer instead.
+        Returns (sha256, size, buffer). Raises on failure and leaves nothing behind.
+        """
+        chunk_size = self.config["chunkSize"]
+        in_memory = self.config["inMemory"]
+        temp_path = None if in_memory else f"{file_path}.{uuid.uuid4().hex[:8]}.part"
+        digest = hashlib.sha256()
+        head, tail, size = b"", b"", 0
+        f = None
+
+        try:
+            async with self._host_limit(url):
+                async with session.get(url, cookies=cookies) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get("Content-Type", "")
+                    if require_pdf_type and not content_type.startswith("application/pdf"):
+                        raise InvalidPdfError(f"unexpected Content-Type {content_type!r}")
+
+                    if in_memory:
+                        f = tempfile.SpooledTemporaryFile(max_size=self.config["spoolMaxBytes"])
+                    else:
+                        f = open(temp_path, "wb")
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                        if len(head) < PDF_SCAN_WINDOW:
+                            head += chunk[:PDF_SCAN_WINDOW - len(head)]
+                        tail = (tail + chunk)[-PDF_SCAN_WINDOW:]
+
+            check_pdf(head, tail, size)
+            if in_memory:
+                f.seek(0)
+                return digest.hexdigest(), size, f
+            f.close()
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if f is not None:
+                f.close()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest.hexdigest(), size, None
+
+    async def _download_one(self, session, stats, item, file_path, cookies, require_pdf_type):
+        for attempt in range(self.config["retries"] + 1):
+            try:
+                sha256, size, buffer = await self.fetch(session, item.document_link, file_path, cookies, require_pdf_type)
+                stats.record(True, size)
+                return DownloadResult(item, file_path, sha256, size, None, buffer)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                if attempt < self.config["retries"]:
+                    stats.retries += 1
+                    await asyncio.sleep(self.config["retryDelay"] * (attempt + 1))
+            except Exception as e:
+                # InvalidPdfError and local errors: a retry would get the same answer
+                error = e
+                break
+        stats.record(False)
+        return DownloadResult(item, None, None, 0, error)
+
+    async def download_all(self, jobs, require_pdf_type=False):
+        """
+        `jobs` is a list of (item, file_path, cookies) where item has a
+        `document_link`. Returns a DownloadResult per job, in order; `path` is None
+        and `error` set for failed ones.
+        """
+        results = [None] * len(jobs)
+        by_url = {}
+        for index, (item, _, _) in enumerate(jobs):
+            seen = self.seen_urls.get(item.document_link)
+            if seen:
+                results[index] = seen._replace(item=item)
+            else:
+                by_url.setdefault(item.document_link, []).append(index)
+
+        stats = DownloadStats(len(by_url), self.config["progressEvery"])
+        timeout = aiohttp.ClientTimeout(total=self.config["timeout"], connect=self.config["connectTimeout"])
+        connector = aiohttp.TCPConnector(limit=self.config["total"], limit_per_host=self.config["perHost"])
+
+        async with aiohttp.ClientSession(headers=self.headers, timeout=timeout, connector=connector) as session:
+            fetched = await asyncio.gather(*[
+                self._download_one(session, stats, *jobs[indexes[0]], require_pdf_type)
+                for indexes in by_url.values()
+            ])
+
+        for indexes, result in zip(by_url.values(), fetched):
+            if result.error is None:
+                # a buffer is freed once its batch is uploaded, so later batches only get the hash
+                self.seen_urls[result.item.document_link] = result._replace(buffer=None)
+            results[indexes[0]] = result._replace(item=jobs[indexes[0]][0])
+            for index in indexes[1:]:
+                # only the first document owns the buffer (recompression replaces and closes
+                # it); repeats are matched to its upload by content hash, like seen_urls
+                results[index] = result._replace(item=jobs[index][0], buffer=None)
+
+        self.stats = dict(stats.summary(), duplicates=len(jobs) - len(by_url))
+        return results
+
+
+def download_documents(jobs, headers=None, require_pdf_type=False, config=DOWNLOAD_CONFIG, seen_urls=None):
+    """Blocking entry point for the court pipelines; see AsyncPdfDownloader.download_all."""
+    downloader = AsyncPdfDownloader(config, headers=headers, seen_urls=seen_urls)
+    results = asyncio.run(downloader.download_all(jobs, require_pdf_type=require_pdf_type))
+    return results, downloader.stats
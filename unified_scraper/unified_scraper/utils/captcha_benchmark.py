@@ -0,0 +1,99 @@
+"""
+Accuracy / latency benchmark for the captcha engines.
+
+Fixtures are labeled images named `<answer>_<n>.<ext>` (or `<answer>.<ext>`),
+one folder per court. `save_captcha_fixture` collects them automatically from
+server-accepted answers when CAPTCHA_FIXTURE_DIR is set.
+
+    python -m unified_scraper.utils.captcha_benchmark captcha_fixtures/karhc
+    python -m unified_scraper.utils.captcha_benchmark captcha_fixtures/karhc --xevil
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from unified_scraper.utils.captcha_resolver import (
+    LocalCaptchaRecognizer,
+    XevilCaptchaSolver,
+    CaptchaSolverChain,
+)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp")
+
+
+def load_fixtures(fixture_dir):
+    fixtures = []
+    for name in sorted(os.listdir(fixture_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+        label = stem.rsplit("_", 1)[0]
+        with open(os.path.join(fixture_dir, name), "rb") as f:
+            fixtures.append((label, f.read()))
+    return fixtures
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run_engine(engine, fixtures):
+    latencies = []
+    answered = correct = 0
+    for label, image in fixtures:
+        started = time.perf_counter()
+        answer = await engine.solve_async(image)
+        latencies.append(time.perf_counter() - started)
+        if answer:
+            answered += 1
+            correct += answer.lower() == label.lower()
+    return {
+        "total": len(fixtures),
+        "answered": answered,
+        "correct": correct,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+    }
+
+
+def print_report(name, result):
+    total = result["total"] or 1
+    answered = result["answered"] or 1
+    print(
+        f"{name:<8} accuracy {result['correct'] / total:6.1%}  "
+        f"answered {result['answered'] / total:6.1%}  "
+        f"precision {result['correct'] / answered:6.1%}  "
+        f"p50 {result['p50'] * 1000:8.1f} ms  "
+        f"p95 {result['p95'] * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark captcha engines on labeled fixtures.")
+    parser.add_argument("fixture_dir")
+    parser.add_argument("--xevil", action="store_true", help="also benchmark XEvil and the full chain (network)")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixture_dir)
+    if not fixtures:
+        print(f"No fixtures found in {args.fixture_dir}")
+        return
+
+    print(f"{len(fixtures)} fixtures from {args.fixture_dir}")
+    local = LocalCaptchaRecognizer()
+    engines = [("local", local)]
+    if args.xevil:
+        xevil = XevilCaptchaSolver()
+        engines += [("xevil", xevil), ("chain", CaptchaSolverChain([local, xevil]))]
+
+    for name, engine in engines:
+        print_report(name, asyncio.run(run_engine(engine, fixtures)))
+
+
+if __name__ == "__main__":
+    main()
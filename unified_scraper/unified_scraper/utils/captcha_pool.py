@@ -0,0 +1,147 @@
+import time
+import asyncio
+import logging
+from itertools import count
+from scrapy.utils.defer import maybe_deferred_to_future
+
+
+async def download_request(crawler, request):
+    """Download a request through the engine (middlewares, cookie jars) and return the response."""
+    return await maybe_deferred_to_future(crawler.engine.download(request))
+
+
+def captcha_retry_budget(settings, court):
+    """Resubmissions allowed per form for `court`, from the CAPTCHA_RETRY_TIMES setting."""
+    return int(settings.getdict("CAPTCHA_RETRY_TIMES").get(court, 2))
+
+
+class CaptchaPool:
+    """
+    Keeps `size` solved captchas warm so form submissions never wait on the solver.
+
+    `solver` is a CaptchaSolverChain. `prepare(jar)` is a coroutine supplied by the
+    spider. It opens a session in the given cookie jar, downloads the captcha image
+    and returns a dict with at least an "image" key, plus whatever else the form
+    needs (CSRF tokens etc.).
+
+    Captchas are bound to the session they were issued to, and fetching a new image
+    invalidates the previous one, so each warm entry lives in its own cookie jar.
+    While one jar is waiting on the solver the other jars are already fetching.
+
+    `demand`, when the spider knows it, is how many entries it will take in all:
+    the pool then never warms more than are still wanted, so no session or solve
+    is paid for only to be cancelled at close. Taking more than `demand` still
+    works, each extra entry is warmed when it is asked for.
+    """
+
+    def __init__(self, prepare, solver, size=4, max_age=600, jar_prefix="captcha", demand=None):
+        self.prepare = prepare
+        self.solver = solver
+        self.size = size
+        self.max_age = max_age
+        self.jar_prefix = jar_prefix
+        self.demand = demand
+        self.logger = logging.getLogger(__name__)
+        self._jar_ids = count()
+        self._ready = None
+        self._tasks = set()
+        # warm-ups running or queued, acquires waiting, and entries handed out
+        self._outstanding = 0
+        self._waiting = 0
+        self._taken = 0
+
+    def _wanted(self):
+        """Warm entries to keep: `size`, or fewer once the remaining demand is smaller."""
+        if self.demand is None:
+            return self.size
+        return min(self.size, max(self.demand - self._taken, 0))
+
+    def _ensure_started(self):
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._top_up()
+
+    def _top_up(self):
+        # every waiting acquire gets a warm-up, even beyond `demand`
+        while self._outstanding < max(self._wanted(), self._waiting):
+            self._fill()
+
+    def _fill(self):
+        self._outstanding += 1
+        task = asyncio.ensure_future(self._warm_one())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _warm_one(self):
+        jar = f"{self.jar_prefix}-{next(self._jar_ids)}"
+        entry = await self.solve_for(jar)
+        # A failed warm-up is still queued (as None) so exactly one waiter sees the failure.
+        await self._ready.put(entry)
+
+    async def solve_for(self, jar, skip=()):
+        """
+        Prepare and solve a captcha in a specific cookie jar, bypassing the warm queue.
+        `skip` names solver engines to leave out (e.g. "local" after a rejected answer).
+        """
+        try:
+            entry = await self.prepare(jar)
+        except Exception as e:
+            self.logger.error(f"[{jar}] Failed to fetch captcha: {e}")
+            return None
+
+        if not entry or not entry.get("image"):
+            self.logger.error(f"[{jar}] No captcha image returned")
+            return None
+
+        captcha_text, engine = await self.solver.solve_with_engine_async(entry["image"], skip=skip)
+        if not captcha_text:
+            return None
+
+        entry.update(jar=jar, captcha=captcha_text, engine=engine, solved_at=time.monotonic())
+        return entry
+
+    async def acquire(self):
+        """
+        Take a solved entry: {"jar", "captcha", "engine", "image", ...}. Each acquire
+        starts a replacement warm-up while `demand` is not met, so the pool stays
+        `size` deep as long as entries are still wanted.
+        Returns None when the warm-up it received failed.
+        """
+        self._ensure_started()
+        while True:
+            self._waiting += 1
+            self._top_up()
+            try:
+                entry = await self._ready.get()
+            finally:
+                self._waiting -= 1
+            self._outstanding -= 1
+            fresh = entry is not None and time.monotonic() - entry["solved_at"] <= self.max_age
+            if fresh:
+                self._taken += 1
+            self._top_up()
+            if entry is None or fresh:
+                return entry
+            self.logger.info(f"[{entry['jar']}] Dropping stale captcha")
+
+    async def acquire_with_retries(self, budget, jar=None, skip=()):
+        """
+        acquire(), or a fresh solve in `jar` when one is given, retried on solver
+        failures at most `budget` times. Returns (entry, retries_used); entry is
+        None once the budget is spent.
+        """
+        used = 0
+        while True:
+            entry = await (self.solve_for(jar, skip=skip) if jar else self.acquire())
+            if entry:
+                return entry, used
+            if used >= budget:
+                self.solver.stats.inc("gave_up")
+                return None, used
+            used += 1
+            self.solver.stats.inc("retries")
+
+    def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
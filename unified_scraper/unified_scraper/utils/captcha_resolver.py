@@ -1,61 +1,339 @@
 import os
-import base64
-import requests
+import io
+import re
+import json
 import time
+import base64
+import asyncio
 import logging
+from collections import Counter, deque
+import aiohttp
+import pytesseract
+from PIL import Image, ImageFilter, ImageOps
 from dotenv import load_dotenv
 
 load_dotenv()
 
 XEvil_CONFIG = {
-    "baseUrl": "http://98.70.40.179/",
+    "baseUrl": os.getenv("BASE_URL_XEVIL", "http://98.70.40.179/"),
     "key": os.getenv("CAPTCHA_KEY"),
     "initialDelay": 5,
     "interval": 5,
-    "retries": 6
+    "retries": 6,
+    "timeout": 30,
+    # adaptive polling, used once `minSamples` latencies have been recorded;
+    # before that polls probe from minDelay
+    "minSamples": 10,
+    "minDelay": 1,
+    "backoff": 1.5,
+}
+
+CAPTCHA_STATS_FILE = os.getenv("CAPTCHA_STATS_FILE", "captcha_latency.json")
+
+LOCAL_OCR_CONFIG = {
+    "enabled": os.getenv("CAPTCHA_LOCAL_OCR", "1") != "0",
+    "whitelist": "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789",
+    "pattern": r"^[A-Za-z0-9]{4,8}$",
+    "minConfidence": 75,
+    "scale": 3,
+    "threshold": 150,
 }
 
+class CaptchaStats:
+    """
+    Per-court solver statistics. The XEvil submit->ready latencies drive the poll
+    schedule and are kept between runs in CAPTCHA_STATS_FILE. Counters and
+    percentiles are mirrored into Scrapy stats under `captcha/<court>/`.
+    """
+
+    def __init__(self, court, crawler_stats=None, window=200, path=CAPTCHA_STATS_FILE):
+        self.court = court
+        self.crawler_stats = crawler_stats
+        self.path = path
+        self.counts = Counter()
+        self.latencies = deque(self._load(), maxlen=window)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get(self.court, [])
+        except (OSError, ValueError):
+            return []
+
+    def save(self):
+        if not self.path:
+            return
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        data[self.court] = list(self.latencies)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def inc(self, key, count=1):
+        self.counts[key] += count
+        if self.crawler_stats:
+            self.crawler_stats.inc_value(f"captcha/{self.court}/{key}", count)
+
+    def set(self, key, value):
+        if self.crawler_stats:
+            self.crawler_stats.set_value(f"captcha/{self.court}/{key}", value)
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+    def record_latency(self, seconds):
+        self.latencies.append(round(seconds, 3))
+        self.inc("xevil/solved")
+        self.publish()
+
+    def record_timeout(self):
+        self.inc("xevil/timeouts")
+        self.publish()
+
+    def record_result(self, engine, accepted):
+        """Server verdict on an answer from `engine`."""
+        self.inc(f"{engine}/{'accepted' if accepted else 'rejected'}")
+        self.publish()
+
+    def publish(self):
+        self.set("latency_p50", self.percentile(50))
+        self.set("latency_p95", self.percentile(95))
+
+        attempts = self.counts["xevil/solved"] + self.counts["xevil/timeouts"]
+        if attempts:
+            self.set("xevil/timeout_rate", round(self.counts["xevil/timeouts"] / attempts, 3))
+
+        for engine in ("local", "xevil"):
+            verdicts = self.counts[f"{engine}/accepted"] + self.counts[f"{engine}/rejected"]
+            if verdicts:
+                self.set(f"{engine}/wrong_answer_rate", round(self.counts[f"{engine}/rejected"] / verdicts, 3))
+
+    def poll_delays(self, config):
+        """
+        Delays before each result poll, within the fixed schedule's overall deadline
+        (initialDelay, then interval until `retries` polls). Until enough latencies
+        are known the polls probe from minDelay and back off to interval, so the
+        recorded latencies (the time of the first successful poll) can come out
+        below initialDelay. After that the first poll happens at the observed
+        median, capped at initialDelay, and later polls back off from a short step.
+        """
+        deadline = config["initialDelay"] + config["interval"] * (config["retries"] - 1)
+        if len(self.latencies) < config["minSamples"]:
+            first = step = config["minDelay"]
+        else:
+            first = min(max(self.percentile(50), config["minDelay"]), config["initialDelay"])
+            step = max(config["minDelay"], (self.percentile(95) - first) / 3)
+
+        delays, elapsed = [first], first
+        while elapsed < deadline:
+            delays.append(step)
+            elapsed += step
+            step = min(step * config["backoff"], config["interval"])
+        return delays
+
+
 class XevilCaptchaSolver:
-    def __init__(self, config=XEvil_CONFIG):
-        self.config = config
+    """
+    XEvil client. `solve_async` never blocks the event loop, so Scrapy callbacks
+    can `await` it while the rest of the crawl keeps running. `solve` is kept for
+    scripts that are not running inside the reactor.
+    """
+
+    name = "xevil"
+
+    def __init__(self, config=XEvil_CONFIG, stats=None):
+        self.config = {**XEvil_CONFIG, **config}
+        self.stats = stats or CaptchaStats("default", path=None)
         self.logger = logging.getLogger(__name__)
 
-    def solve(self, captcha_bytes):
+    async def solve_async(self, captcha_bytes):
         try:
             base64_image = base64.b64encode(captcha_bytes).decode('utf-8')
-            submit = requests.post(
-                self.config["baseUrl"] + "in.php",
-                data={
-                    "key": self.config["key"],
-                    "method": "base64",
-                    "body": base64_image
-                }
-            )
-            if "OK|" not in submit.text:
-                self.logger.warning(" Failed to submit CAPTCHA to XEvil")
-                return None
-
-            captcha_id = submit.text.split("|")[1]
-            time.sleep(self.config["initialDelay"])
-
-            for _ in range(self.config["retries"]):
-                poll = requests.get(
-                    self.config["baseUrl"] + "res.php",
-                    params={
+            timeout = aiohttp.ClientTimeout(total=self.config["timeout"])
+
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(
+                    self.config["baseUrl"] + "in.php",
+                    data={
                         "key": self.config["key"],
-                        "action": "get",
-                        "id": captcha_id
+                        "method": "base64",
+                        "body": base64_image
                     }
-                )
-                if "OK|" in poll.text:
-                    captcha_text = poll.text.split("|")[1]
-                    print(f"[XEvil Captcha Solved] => {captcha_text}")
-                    return captcha_text
-                time.sleep(self.config["interval"])
+                ) as submit:
+                    submit_text = await submit.text()
+
+                if "OK|" not in submit_text:
+                    self.logger.warning(" Failed to submit CAPTCHA to XEvil")
+                    return None
+
+                captcha_id = submit_text.split("|")[1]
+                submitted_at = time.monotonic()
 
+                for delay in self.stats.poll_delays(self.config):
+                    await asyncio.sleep(delay)
+                    async with session.get(
+                        self.config["baseUrl"] + "res.php",
+                        params={
+                            "key": self.config["key"],
+                            "action": "get",
+                            "id": captcha_id
+                        }
+                    ) as poll:
+                        poll_text = await poll.text()
+
+                    if "OK|" in poll_text:
+                        captcha_text = poll_text.split("|")[1]
+                        self.stats.record_latency(time.monotonic() - submitted_at)
+                        self.logger.info(f"[XEvil Captcha Solved] => {captcha_text}")
+                        return captcha_text
+
+            self.stats.record_timeout()
             self.logger.warning("CAPTCHA solving timed out.")
             return None
 
         except Exception as e:
             self.logger.error(f" CAPTCHA solving failed: {str(e)}")
             return None
+
+    def solve(self, captcha_bytes):
+        """Blocking wrapper around `solve_async`. Do not call it from a Scrapy callback."""
+        return asyncio.run(self.solve_async(captcha_bytes))
+
+
+class LocalCaptchaRecognizer:
+    """
+    Offline recognizer for the simple numeric/alphanumeric captchas: upscale,
+    denoise, threshold, then tesseract restricted to a character whitelist.
+    Answers below `minConfidence` or not matching `pattern` are returned as None
+    so the next engine in the chain gets a try.
+    """
+
+    name = "local"
+
+    def __init__(self, config=LOCAL_OCR_CONFIG):
+        self.config = {**LOCAL_OCR_CONFIG, **config}
+        self.logger = logging.getLogger(__name__)
+
+    def preprocess(self, captcha_bytes):
+        image = Image.open(io.BytesIO(captcha_bytes)).convert("L")
+        scale = self.config["scale"]
+        image = image.resize((image.width * scale, image.height * scale), Image.LANCZOS)
+        image = image.filter(ImageFilter.MedianFilter(3))
+        threshold = self.config["threshold"]
+        image = image.point(lambda p: 255 if p > threshold else 0)
+        # tesseract expects dark text on a light background
+        if image.getpixel((0, 0)) == 0:
+            image = ImageOps.invert(image)
+        return image
+
+    def recognize(self, captcha_bytes):
+        """Return (text, confidence) where confidence is the weakest word's score."""
+        image = self.preprocess(captcha_bytes)
+        data = pytesseract.image_to_data(
+            image,
+            config=f"--psm 7 -c tessedit_char_whitelist={self.config['whitelist']}",
+            output_type=pytesseract.Output.DICT,
+        )
+        words = [
+            (text.strip(), float(conf))
+            for text, conf in zip(data["text"], data["conf"])
+            if text.strip() and float(conf) >= 0
+        ]
+        if not words:
+            return "", 0.0
+        return "".join(text for text, _ in words), min(conf for _, conf in words)
+
+    async def solve_async(self, captcha_bytes):
+        if not self.config["enabled"]:
+            return None
+        try:
+            text, confidence = await asyncio.to_thread(self.recognize, captcha_bytes)
+        except Exception as e:
+            self.logger.warning(f"Local captcha OCR failed: {e}")
+            return None
+
+        if confidence < self.config["minConfidence"] or not re.match(self.config["pattern"], text):
+            self.logger.debug(f"Local captcha OCR rejected '{text}' (confidence {confidence:.0f})")
+            return None
+
+        self.logger.info(f"[Local Captcha Solved] => {text} (confidence {confidence:.0f})")
+        return text
+
+    def solve(self, captcha_bytes):
+        return asyncio.run(self.solve_async(captcha_bytes))
+
+
+class CaptchaSolverChain:
+    """
+    Tries each engine in order and returns the first answer. Engines that were
+    already rejected by the server for this captcha can be skipped by name, so a
+    resubmission goes straight to XEvil.
+    """
+
+    def __init__(self, engines, stats=None):
+        self.engines = engines
+        self.stats = stats or CaptchaStats("default", path=None)
+        self.logger = logging.getLogger(__name__)
+
+    async def solve_with_engine_async(self, captcha_bytes, skip=()):
+        """Return (captcha_text, engine_name), or (None, None) when every engine gave up."""
+        for engine in self.engines:
+            if engine.name in skip:
+                continue
+            captcha_text = await engine.solve_async(captcha_bytes)
+            if captcha_text:
+                self.stats.inc(f"{engine.name}/answered")
+                return captcha_text, engine.name
+        self.stats.inc("unsolved")
+        return None, None
+
+    async def solve_async(self, captcha_bytes, skip=()):
+        captcha_text, _ = await self.solve_with_engine_async(captcha_bytes, skip=skip)
+        return captcha_text
+
+    def solve(self, captcha_bytes, skip=()):
+        return asyncio.run(self.solve_async(captcha_bytes, skip=skip))
+
+    def report_result(self, engine, accepted):
+        """Record whether the court accepted an answer produced by `engine`."""
+        if engine:
+            self.stats.record_result(engine, accepted)
+
+    def close(self):
+        self.stats.save()
+
+
+def build_solver_chain(court="default", crawler_stats=None, xevil_config=XEvil_CONFIG, ocr_config=LOCAL_OCR_CONFIG):
+    """Local OCR first, XEvil as the fallback, sharing one CaptchaStats for `court`."""
+    stats = CaptchaStats(court, crawler_stats)
+    return CaptchaSolverChain([
+        LocalCaptchaRecognizer(ocr_config),
+        XevilCaptchaSolver(xevil_config, stats=stats),
+    ], stats=stats)
+
+
+def save_captcha_fixture(captcha_bytes, captcha_text, court):
+    """
+    Keep a server-accepted captcha as a labeled fixture for captcha_benchmark.
+    Only active when CAPTCHA_FIXTURE_DIR is set.
+    """
+    fixture_dir = os.getenv("CAPTCHA_FIXTURE_DIR")
+    if not fixture_dir or not captcha_bytes or not captcha_text:
+        return
+    folder = os.path.join(fixture_dir, court)
+    os.makedirs(folder, exist_ok=True)
+    index = len(os.listdir(folder))
+    with open(os.path.join(folder, f"{captcha_text}_{index}.png"), "wb") as f:
+        f.write(captcha_bytes)
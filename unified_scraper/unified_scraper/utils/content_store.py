@@ -0,0 +1,143 @@
+import os
+import time
+import sqlite3
+import logging
+from sqlalchemy.orm import Session
+from Database.models import Document, DOCUMENT_UPLOADED
+
+CONTENT_INDEX_FILE = os.getenv("CONTENT_INDEX_FILE", "content_index.sqlite")
+LOOKUP_CHUNK = 500  # hashes per IN (...) query
+
+
+class ContentStore:
+    """
+    Content-addressed view of what is already in blob storage, keyed by the PDF's
+    SHA-256 as downloaded. A hash is looked up in the local index
+    (CONTENT_INDEX_FILE), then in the Documents table, which covers uploads made
+    from other machines. When a `container_client` is given, a hit is only
+    trusted if the blob still exists.
+
+    A blob may hold a recompressed PDF (RECOMPRESS_PDF). Documents then records
+    the SHA-256 and size of the blob, and only the local index still maps the
+    downloaded content to it, next to the blob's own hash (`blob_sha256`).
+
+    A document whose content is already stored needs no OCR and no upload; its
+    Documents row simply points at the existing blob.
+    """
+
+    def __init__(self, path=CONTENT_INDEX_FILE, session: Session = None, container_client=None):
+        self.path = path
+        self.session = session
+        self.container_client = container_client
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(path or ":memory:")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha256 TEXT PRIMARY KEY, blob_path TEXT NOT NULL, size INTEGER, stored_at REAL)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(blobs)")}
+        if "blob_sha256" not in columns:
+            # NULL for entries written before recompressed blobs were told apart
+            self.db.execute("ALTER TABLE blobs ADD COLUMN blob_sha256 TEXT")
+            self.db.commit()
+        self.hits = 0
+
+    def _blob_exists(self, blob_path):
+        if self.container_client is None:
+            return True
+        try:
+            return self.container_client.get_blob_client(blob_path).exists()
+        except Exception as e:
+            self.logger.warning(f"Could not check blob {blob_path}: {e}")
+            return False
+
+    def _from_database(self, sha256):
+        if self.session is None:
+            return None
+        row = (
+            self.session.query(Document.blob_path)
+            .filter(
+                Document.content_hash == sha256,
+                Document.status == DOCUMENT_UPLOADED,
+                Document.blob_path.isnot(None)
+            )
+            .first()
+        )
+        return row.blob_path if row else None
+
+    def find(self, sha256):
+        """Blob path already holding this content, or None."""
+        if not sha256:
+            return None
+        row = self.db.execute("SELECT blob_path FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        blob_path = row[0] if row else self._from_database(sha256)
+        if blob_path is None:
+            return None
+
+        if not self._blob_exists(blob_path):
+            self.logger.info(f"Blob {blob_path} for {sha256[:12]} is gone, uploading again")
+            self.db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            self.db.commit()
+            return None
+
+        if row is None:
+            self.add(sha256, blob_path)
+        self.hits += 1
+        return blob_path
+
+    def find_many(self, hashes):
+        """{sha256: blob_path} for the hashes whose content is already stored."""
+        return {sha256: stored[0] for sha256, stored in self.find_stored(hashes).items()}
+
+    def find_stored(self, hashes):
+        """
+        {sha256: (blob_path, blob SHA-256, blob size)} for the hashes whose content
+        is already stored, with one local and one Documents query per LOOKUP_CHUNK
+        hashes instead of one per file. The blob size may be None for old entries.
+        """
+        hashes = list({h for h in hashes if h})
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[start:start + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            for sha256, blob_path, blob_sha256, size in self.db.execute(
+                "SELECT sha256, blob_path, COALESCE(blob_sha256, sha256), size "
+                f"FROM blobs WHERE sha256 IN ({placeholders})", chunk
+            ).fetchall():
+                found[sha256] = (blob_path, blob_sha256, size)
+
+            missing = [h for h in chunk if h not in found]
+            if missing and self.session is not None:
+                rows = (
+                    self.session.query(Document.content_hash, Document.blob_path, Document.size_bytes)
+                    .filter(
+                        Document.content_hash.in_(missing),
+                        Document.status == DOCUMENT_UPLOADED,
+                        Document.blob_path.isnot(None)
+                    )
+                    .all()
+                )
+                for row in rows:
+                    # a Documents hash is the blob's own, so the blob holds exactly this content
+                    self.add(row.content_hash, row.blob_path, row.size_bytes, blob_sha256=row.content_hash)
+                    found[row.content_hash] = (row.blob_path, row.content_hash, row.size_bytes)
+
+        for sha256, (blob_path, _, _) in list(found.items()):
+            if not self._blob_exists(blob_path):
+                self.logger.info(f"Blob {blob_path} for {sha256[:12]} is gone, uploading again")
+                self.db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                self.db.commit()
+                del found[sha256]
+        self.hits += len(found)
+        return found
+
+    def add(self, sha256, blob_path, size=None, blob_sha256=None):
+        """Map downloaded content `sha256` to `blob_path`, whose bytes hash to `blob_sha256` (and are `size` long)."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO blobs (sha256, blob_path, size, stored_at, blob_sha256) VALUES (?, ?, ?, ?, ?)",
+            (sha256, blob_path, size, time.time(), blob_sha256 or sha256),
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
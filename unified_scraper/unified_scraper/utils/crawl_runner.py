@@ -0,0 +1,114 @@
+import sys
+import logging
+from scrapy import signals
+from scrapy.crawler import Crawler, CrawlerRunner
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from twisted.python.failure import Failure
+
+
+class SpiderJob:
+    """One spider of a SpiderRun: its scraped items (when kept), final stats and error."""
+
+    def __init__(self, crawler, kwargs, after=None, keep_items=True):
+        self.crawler = crawler
+        self.kwargs = kwargs
+        self.after = after
+        self.items = []
+        self.stats = {}
+        self.error = None
+        self.finished = False
+        if keep_items:
+            crawler.signals.connect(self._item_scraped, signal=signals.item_scraped)
+
+    @property
+    def name(self):
+        return self.crawler.spidercls.name
+
+    def running(self):
+        """True until the spider has closed; a spider started `after` another waits meanwhile."""
+        return not self.finished
+
+    def _item_scraped(self, item, response, spider):
+        self.items.append(item)
+
+    def summary(self):
+        return {
+            "items": self.stats.get("item_scraped_count", 0),
+            "requests": self.stats.get("downloader/request_count", 0),
+            "finish_reason": self.stats.get("finish_reason"),
+            "error": str(self.error) if self.error else None,
+        }
+
+
+class SpiderRun:
+    """
+    Runs spiders inside this process, in one Twisted reactor, instead of a
+    `scrapy crawl` process per spider: project settings and spider modules are
+    loaded once, and items and stats come back in memory on each SpiderJob.
+
+        run = SpiderRun({"CONCURRENT_REQUESTS": 16})
+        listing = run.add("phhc_case_form_dynamic", run_id=run_id)
+        pdfs = run.add("general", after=listing, run_id=run_id)
+        run.run()
+        listing.items, pdfs.stats
+
+    Spiders added without `after` crawl side by side; one added `after` another
+    starts when that one has closed, and is skipped if it failed. `settings`
+    override the project settings of every spider, a job's `feed` writes a copy
+    of its items to CSV. Like CrawlerProcess, `run` blocks until every spider is
+    done, and a process can only run once (the reactor cannot be restarted).
+    """
+
+    def __init__(self, settings=None):
+        self.settings = get_project_settings()
+        self.settings.setdict(settings or {}, priority="cmdline")
+        if "twisted.internet.reactor" not in sys.modules:
+            install_reactor(self.settings["TWISTED_REACTOR"])
+        self.runner = CrawlerRunner(self.settings)
+        self.jobs = []
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, spider, after=None, feed=None, keep_items=True, **kwargs):
+        """Add a spider (class or name); `kwargs` are its arguments, as with `-a`."""
+        spidercls = self.runner.spider_loader.load(spider) if isinstance(spider, str) else spider
+        settings = self.settings.copy()
+        if feed:
+            settings.set("FEEDS", {feed: {"format": "csv"}}, priority="cmdline")
+        job = SpiderJob(Crawler(spidercls, settings), kwargs, after, keep_items)
+        self.jobs.append(job)
+        return job
+
+    def _start(self, job):
+        self.logger.info(f"Starting spider {job.name}")
+        deferred = self.runner.crawl(job.crawler, **job.kwargs)
+        deferred.addBoth(self._finished, job)
+
+    def _finished(self, result, job):
+        job.finished = True
+        job.stats = job.crawler.stats.get_stats() if job.crawler.stats else {}
+        if isinstance(result, Failure):
+            job.error = result.value
+            self.logger.error(f"Spider {job.name} failed: {result.getErrorMessage()}")
+        else:
+            self.logger.info(f"Spider {job.name} finished: {job.summary()}")
+        for waiting in self.jobs:
+            if waiting.after is job:
+                if job.error is None:
+                    self._start(waiting)
+                else:
+                    self._finished(Failure(RuntimeError(f"skipped, {job.name} failed")), waiting)
+        if all(j.finished for j in self.jobs):
+            from twisted.internet import reactor
+            reactor.stop()
+
+    def run(self):
+        """Crawl every added spider; returns the jobs."""
+        if not self.jobs:
+            return self.jobs
+        from twisted.internet import reactor
+        for job in self.jobs:
+            if job.after is None:
+                reactor.callWhenRunning(self._start, job)
+        reactor.run()
+        return self.jobs
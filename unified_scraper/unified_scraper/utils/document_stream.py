@@ -0,0 +1,183 @@
+import os
+import shutil
+import queue
+import asyncio
+import logging
+import threading
+from Database.high_court_database import SessionLocal
+from unified_scraper.utils.pdf_downloader import (
+    follow_pending_pdfs,
+    attach_extracted_text,
+    split_downloaded,
+    record_downloads,
+)
+from unified_scraper.utils.async_downloader import DOWNLOAD_CONFIG
+from unified_scraper.utils.text_extraction import TextExtractionStage
+from unified_scraper.utils.upload_to_azure import upload_to_azure
+from unified_scraper.utils.run_manifest import RunManifest
+
+STREAM_CONFIG = {
+    # documents per download batch; smaller batches reach storage sooner
+    "batchSize": int(os.getenv("STREAM_BATCH_SIZE", "100")),
+    # downloaded batches waiting for upload; while the queue is full downloading pauses
+    "uploadQueue": int(os.getenv("STREAM_UPLOAD_QUEUE", "2")),
+    # how often to look for newly crawled documents while the crawl runs
+    "pollSeconds": float(os.getenv("STREAM_POLL_SECONDS", "30")),
+}
+
+
+class BatchExtraction:
+    """
+    Handed to a downloader as its text stage: submits to the real `stage` and
+    keeps the futures, so the batch can be uploaded once they are done.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.futures = []
+
+    def submit(self, pdf_path, data=None):
+        future = self.stage.submit(pdf_path, data=data)
+        self.futures.append(future)
+        return future
+
+
+class UploadStage:
+    """
+    Uploads batches of downloaded files on a thread of its own while the next
+    ones are downloaded. A batch is taken once its text extraction futures are
+    done; `put` blocks while `queue_size` batches are already waiting, so a
+    slow upload holds back the downloads instead of piling them up on disk or
+    in memory.
+    """
+
+    def __init__(self, local_base, queue_size=None):
+        self.local_base = local_base
+        self.queue = queue.Queue(maxsize=queue_size or STREAM_CONFIG["uploadQueue"])
+        self.logger = logging.getLogger(__name__)
+        self.files = []
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, name="upload", daemon=True)
+        self.thread.start()
+
+    def put(self, batch, futures=(), text_stage=None):
+        """Queue `batch` for upload after `futures` (submitted to `text_stage`) are done."""
+        if batch:
+            self.queue.put((batch, list(futures), text_stage))
+
+    async def put_async(self, batch, futures=(), text_stage=None):
+        """`put` from a coroutine: waits for room in the queue in a thread, not on the loop."""
+        await asyncio.to_thread(self.put, batch, futures, text_stage)
+
+    def _run(self):
+        session = SessionLocal()
+        try:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    return
+                batch, futures, text_stage = entry
+                try:
+                    if futures:
+                        attach_extracted_text(batch, text_stage.wait_for(futures))
+                    upload_to_azure(session, batch, local_base=self.local_base, remove_local_base=False)
+                    self.files += batch
+                except Exception as e:
+                    self.errors.append(str(e))
+                    self.logger.exception(f"Upload of {len(batch)} files failed: {e}")
+        finally:
+            session.close()
+
+    def close(self):
+        """Upload what is still queued, then delete what is left of `local_base`."""
+        self.queue.put(None)
+        self.thread.join()
+        if os.path.exists(self.local_base):
+            shutil.rmtree(self.local_base, ignore_errors=True)
+        self.logger.info(f"Uploaded {len(self.files)} files from {self.local_base}")
+
+
+class DocumentStream:
+    """
+    Download → text extraction → upload for the documents of a court, running
+    while its crawl is still inserting them. Each bench gets a download thread
+    that follows its pending documents (see follow_pending_pdfs); downloaded
+    batches are extracted on a shared TextExtractionStage and handed to one
+    UploadStage. Every stage is bounded, so the slowest one sets the pace.
+
+    `download(session=..., pdf_items=..., seen_urls=..., text_stage=...)` is the
+    court's batch downloader; a bench's downloads start once `ready(bench_name)`
+    is true (say, the crawl saved its session) or the crawl is over. Call
+    `crawl_finished` when the crawl is over (or right away if there is none),
+    then `join` for the downloaded files.
+    """
+
+    def __init__(self, court, high_court_name, bench_names, root_folder, download, run_id=None, ready=None):
+        self.court = court
+        self.high_court_name = high_court_name
+        self.bench_names = bench_names
+        self.download = download
+        self.run_id = run_id
+        self.ready = ready
+        self.logger = logging.getLogger(__name__)
+        self.crawl_done = threading.Event()
+        self.text_stage = TextExtractionStage()
+        self.uploads = UploadStage(root_folder)
+        self.errors = []
+        self.threads = [
+            threading.Thread(target=self._download, args=(bench_name,), name=f"download-{bench_name}", daemon=True)
+            for bench_name in bench_names
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def crawl_finished(self):
+        self.crawl_done.set()
+
+    def crawling(self):
+        return not self.crawl_done.is_set()
+
+    def _download(self, bench_name):
+        session = SessionLocal()
+        # sqlite connections stay on their thread, so each downloader opens the run itself
+        manifest = RunManifest(self.court, run_id=self.run_id) if self.run_id else None
+        in_memory = DOWNLOAD_CONFIG["inMemory"]
+        done = manifest.items("download") if manifest and not in_memory else {}
+        seen_urls = {}
+        try:
+            while self.ready and not self.ready(bench_name) and self.crawling():
+                self.crawl_done.wait(STREAM_CONFIG["pollSeconds"])
+            for pdf_items in follow_pending_pdfs(
+                session, self.high_court_name, bench_name, self.crawling,
+                batch_size=STREAM_CONFIG["batchSize"], poll_seconds=STREAM_CONFIG["pollSeconds"],
+                wait=self.crawl_done.wait,
+            ):
+                extraction = BatchExtraction(self.text_stage)
+                pdf_items, batch = split_downloaded(pdf_items, done, extraction)
+                if pdf_items:
+                    downloaded = self.download(
+                        session=session, pdf_items=pdf_items, seen_urls=seen_urls, text_stage=extraction
+                    )
+                    if manifest and not in_memory:
+                        record_downloads(manifest, downloaded)
+                    batch += downloaded
+                self.uploads.put(batch, extraction.futures, self.text_stage)
+        except Exception as e:
+            self.errors.append(f"{bench_name or self.high_court_name}: {e}")
+            self.logger.exception(f"PDF download failed for {bench_name or self.high_court_name}: {e}")
+        finally:
+            session.close()
+            if manifest is not None:
+                manifest.close()
+
+    def join(self):
+        """Wait until every document is through; returns the files that reached the upload stage."""
+        for thread in self.threads:
+            thread.join()
+        self.uploads.close()
+        self.text_stage.close()
+        self.errors += self.uploads.errors
+        return self.uploads.files
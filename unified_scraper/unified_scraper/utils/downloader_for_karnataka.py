@@ -1,9 +1,10 @@
 import os
 import json
-import requests
 from datetime import datetime
-import fitz  # PyMuPDF
 import re
+from unified_scraper.utils.pdf_downloader import mark_download_failed, extract_downloaded_text, attach_extracted_text
+from unified_scraper.utils.async_downloader import DOWNLOAD_CONFIG, download_documents
+from unified_scraper.utils.content_store import ContentStore
 
 def sanitize_filename(name: str) -> str:
     """Remove invalid characters for filenames."""
@@ -24,37 +25,18 @@ bench_map = {
 }
 
 
-def pdf_to_txt(pdf_path):
-    """
-    Convert a PDF file to TXT and save in the same directory.
-    """
-    txt_path = os.path.splitext(pdf_path)[0] + ".txt"
-    try:
-        with fitz.open(pdf_path) as pdf_doc:
-            text_content = ""
-            for page in pdf_doc:
-                text_content += page.get_text()
-
-        with open(txt_path, "w", encoding="utf-8") as txt_file:
-            txt_file.write(text_content)
-
-    except Exception as e:
-        print(f" Failed to convert {pdf_path} to TXT: {e}")
-
-
-def download_pdfs(pdf_items, root_folder):
+def download_pdfs(pdf_items, root_folder, session=None, seen_urls=None, text_stage=None):
     with open("cookies.json", "r") as f:
         cookies_data = json.load(f)
     today = datetime.today()
     month, day =  today.strftime("%m"), today.strftime("%d")
 
-    downloaded_files = []
+    jobs = []
 
     for i, item in enumerate (pdf_items):
-        pdf_url = item["document_link"]
-        case_id = item["case_id"]
-        bench = item.get("bench", "unknown").replace(" ", "_")
-        date = str(item.get("date", "")).replace("-", "")
+        case_id = item.case_id
+        bench = (item.bench or "unknown").replace(" ", "_")
+        date = str(item.date or "").replace("-", "")
 
         # Find correct bench_code for cookies
         bench_code = None
@@ -67,37 +49,53 @@ def download_pdfs(pdf_items, root_folder):
             print(f"[{i}]  No cookies found for {bench}, skipping {case_id}")
             continue
 
-        cookies = cookies_data[bench_code]
-
         # Create folder path: root/year/month/day/karhc/bench_name/
         folder_path = os.path.join(root_folder, month, day, "karhc", bench)
-        os.makedirs(folder_path, exist_ok=True)
+        if not DOWNLOAD_CONFIG["inMemory"]:
+            os.makedirs(folder_path, exist_ok=True)
 
-        try:
-            r = requests.get(pdf_url, headers=headers, cookies=cookies, timeout=15)
-            if r.status_code == 200 and r.headers.get("Content-Type", "").startswith("application/pdf"):
-                safe_filename = f"{sanitize_filename(case_id)}_{date}.pdf"
-                file_path = os.path.join(folder_path, safe_filename)
+        # a case can have several orders on one date, so the document id keeps names unique
+        safe_filename = f"{sanitize_filename(case_id)}_{date}_{item.document_id}.pdf"
+        jobs.append((item, os.path.join(folder_path, safe_filename), cookies_data[bench_code]))
 
-                with open(file_path, "wb") as f:
-                    f.write(r.content)
+    results, stats = download_documents(jobs, headers=headers, require_pdf_type=True, seen_urls=seen_urls)
+    print(f"Download batch finished: {stats}")
 
-                print(f"[{i}]  Saved {file_path}")
-
-                # Convert to TXT
-                pdf_to_txt(file_path)
-
-                # Collect metadata
-                downloaded_files.append({
-                    "id": item.get("id"),
-                    "case_id": case_id,
-                    "pdf_path": file_path
-                })
-
-            else:
-                print(f"[{i}]  Failed {case_id}: {r.status_code}, {r.text[:200]}")
+    # content already in storage (or converted earlier in this batch) needs no text extraction
+    content_store = ContentStore(session=session)
+    converted = set()
+    downloaded_files = []
 
-        except Exception as e:
-            print(f"[{i}]  Error downloading {case_id}: {e}")
+    for i, result in enumerate(results):
+        item, file_path, sha256, size, error, buffer = result
+        if error is not None:
+            print(f"[{i}]  Error downloading {item.case_id}: {error}")
+            mark_download_failed(session, item.document_id)
+            continue
 
+        print(f"[{i}]  Saved {file_path}")
+
+        # Collect metadata
+        downloaded = {
+            "document_id": item.document_id,
+            "id": item.id,
+            "case_id": item.case_id,
+            "pdf_path": file_path,
+            "content_hash": sha256,
+            "size_bytes": size,
+            "buffer": buffer,
+        }
+
+        # Convert to TXT unless the content was seen before
+        if sha256 in converted or content_store.find(sha256):
+            print(f"[{i}] Same content already processed, skipping text extraction")
+        else:
+            extracted = extract_downloaded_text(result, text_stage)
+            if extracted:
+                attach_extracted_text([downloaded], [extracted])
+            converted.add(sha256)
+
+        downloaded_files.append(downloaded)
+
+    content_store.close()
     return downloaded_files
@@ -1,18 +1,157 @@
 import pandas as pd
 from datetime import datetime
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from Database.models import MetaData, HighCourt
+from Database.models import MetaData, HighCourt, Document, link_hash
 from Database.high_court_database import SessionLocal
 import os
 import json
 
 
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+
+
+def clean_value(value):
+    if value is None or isinstance(value, (list, tuple)):
+        return value
+    if pd.isna(value):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_judgement_date(raw_date):
+    """Normalize the court date formats to a date; unknown formats are passed through."""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw_date, fmt).date()
+        except ValueError:
+            continue
+    return raw_date
+
+
+def get_or_create_highcourt(session: Session, high_court_name: str, base_link: str, bench_name: str, pdf_folder: str):
+    highcourt = (
+        session.query(HighCourt)
+        .filter(
+            HighCourt.highcourt_name == high_court_name,
+            HighCourt.bench == bench_name
+        )
+        .first()
+    )
+    if not highcourt:
+        highcourt = HighCourt(
+            highcourt_name=high_court_name,
+            base_link=base_link,
+            bench=bench_name,
+            pdf_folder=pdf_folder
+        )
+        session.add(highcourt)
+        session.commit()
+        session.refresh(highcourt)
+        print(f"Added new High Court: {high_court_name} ({bench_name})")
+    return highcourt
+
+
+def insert_documents(session: Session, high_court_id: int, pairs):
+    """
+    Add the Documents row (download state) for each upserted (case_id, link_hash)
+    in `pairs`. MySQL does not return ids from a multi-row upsert, so the parent
+    ids are looked up by their full unique key (court, case_id, link_hash).
+    """
+    parents = (
+        session.query(MetaData.id, MetaData.case_id, MetaData.link_hash)
+        .filter(
+            MetaData.high_court_id == high_court_id,
+            tuple_(MetaData.case_id, MetaData.link_hash).in_(list(pairs))
+        )
+        .all()
+    )
+    documents = []
+    for parent in parents:
+        value = pairs.get((parent.case_id, parent.link_hash))
+        if value:
+            documents.append({
+                "metadata_id": parent.id,
+                "high_court_id": high_court_id,
+                "url": value["url"],
+                "url_hash": parent.link_hash,
+            })
+    if documents:
+        statement = insert(Document).values(documents)
+        session.execute(statement.on_duplicate_key_update(url_hash=statement.inserted.url_hash))
+
+
+def insert_judgment_rows(session: Session, rows, high_court_name: str, base_link: str, pdf_folder: str, bench_name: str = None):
+    """
+    Upsert scraped rows ({"case_no", "date", "party", "pdf_link"[, "bench"]}) with one
+    multi-row INSERT ... ON DUPLICATE KEY UPDATE per bench. `pdf_link` may be a single
+    link or a list; each (case_id, pdf_link) becomes its own row. Rows already stored
+    are left untouched by the unique key on (high_court_id, case_id, link_hash), so
+    the cost depends on the batch, not on the table size.
+    Returns (stored, skipped): stored counts new and already present rows alike,
+    skipped counts incomplete rows and repeats within the batch.
+    """
+    grouped = {}
+    skip_count = 0
+    scrapped_at = datetime.now()
+
+    for row in rows:
+        case_id = clean_value(row.get("case_no"))
+        raw_date = clean_value(row.get("date"))
+        party_detail = clean_value(row.get("party"))
+        bench = clean_value(row.get("bench")) or bench_name
+        links = clean_value(row.get("pdf_link")) or []
+        if isinstance(links, str):
+            links = [links]
+
+        for document_link in links:
+            document_link = clean_value(document_link)
+            if not all([case_id, raw_date, document_link]):
+                skip_count += 1
+                continue
+
+            key = (case_id, link_hash(document_link))
+            pairs = grouped.setdefault(bench, {})
+            if key in pairs:
+                skip_count += 1
+                continue
+
+            pairs[key] = {
+                "case_id": case_id,
+                "judgement_date": parse_judgement_date(raw_date),
+                "party_detail": party_detail,
+                "document_link": json.dumps([document_link]),
+                "link_hash": key[1],
+                "url": document_link,
+                "scrapped_at": scrapped_at,
+                "is_downloaded": False,
+            }
+
+    stored_count = 0
+    for bench, pairs in grouped.items():
+        highcourt = get_or_create_highcourt(session, high_court_name, base_link, bench, pdf_folder)
+        values = [
+            {column: v for column, v in value.items() if column != "url"}
+            | {"high_court_id": highcourt.id}
+            for value in pairs.values()
+        ]
+        statement = insert(MetaData).values(values)
+        # no-op update: keeps the stored row (and its is_downloaded flag) as it is
+        session.execute(statement.on_duplicate_key_update(link_hash=statement.inserted.link_hash))
+        insert_documents(session, highcourt.id, pairs)
+        stored_count += len(values)
+
+    session.commit()
+    return stored_count, skip_count
+
 
 def insert_judgments_from_csv(csv_path: str, high_court_name: str, base_link: str, bench_name: str, pdf_folder: str):
     """
     Insert judgment metadata from CSV into DB, avoiding duplicates based on
-    (case_id, document_link, high_court_id) combination.
+    (case_id, document_link, high_court_id) combination (enforced by the unique key).
     Each (case_id, pdf_link) becomes a new row instead of appending to JSON.
     """
     #  Load CSV
@@ -34,93 +173,17 @@ def insert_judgments_from_csv(csv_path: str, high_court_name: str, base_link: st
     session: Session = SessionLocal()
 
     try:
-        # Ensure High Court exists
-        highcourt = (
-            session.query(HighCourt)
-            .filter(
-                HighCourt.highcourt_name == high_court_name,
-                HighCourt.bench == bench_name
-            )
-            .first()
-        )
-        if not highcourt:
-            highcourt = HighCourt(
-                highcourt_name=high_court_name,
+        try:
+            stored_count, skip_count = insert_judgment_rows(
+                session,
+                df.to_dict("records"),
+                high_court_name=high_court_name,
                 base_link=base_link,
-                bench=bench_name,
-                pdf_folder=pdf_folder
-            )
-            session.add(highcourt)
-            session.commit()
-            session.refresh(highcourt)
-            print(f"Added new High Court: {high_court_name}")
-
-        # Load existing (case_id, document_link) pairs
-        rows = (
-            session.query(MetaData.case_id, MetaData.document_link)
-            .filter_by(high_court_id=highcourt.id)
-            .all()
-        )
-        existing_pairs: set[tuple[str, str]] = set()
-        for row in rows:
-            links = []
-            if row.document_link:
-                if isinstance(row.document_link, str):
-                    try:
-                        links = json.loads(row.document_link)
-                    except Exception:
-                        links = [row.document_link]
-                elif isinstance(row.document_link, list):
-                    links = row.document_link
-            for link in links:
-                existing_pairs.add((row.case_id, link))
-
-        insert_count = 0
-        skip_count = 0
-        seen_csv_pairs = set()  
-
-        for idx, row in df.iterrows():
-            case_id = str(row['case_no']).strip() if pd.notna(row['case_no']) else None
-            raw_date = str(row['date']).strip() if pd.notna(row['date']) else None
-            party_detail = str(row['party']).strip() if pd.notna(row['party']) else None
-            document_link = str(row['pdf_link']).strip() if pd.notna(row['pdf_link']) else None
-
-            if not all([case_id, raw_date, party_detail, document_link]):
-                print(f"Row {idx} skipped: Missing fields.")
-                skip_count += 1
-                continue
-
-            # Normalize pair
-            pair = (case_id, document_link)
-
-            if pair in existing_pairs:
-                print(f"Row {idx} skipped: Already in DB (case_id={case_id}, link={document_link})")
-                skip_count += 1
-                continue
-
-            if pair in seen_csv_pairs:
-                print(f"Row {idx} skipped: Duplicate inside CSV (case_id={case_id}, link={document_link})")
-                skip_count += 1
-                continue
-
-            # Insert new row
-            metadata = MetaData(
-                high_court_id=highcourt.id,
-                case_id=case_id,
-                judgement_date=raw_date,
-                party_detail=party_detail,
-                document_link=json.dumps([document_link]),
-                scrapped_at=datetime.now(),
-                is_downloaded=False
+                pdf_folder=pdf_folder,
+                bench_name=bench_name,
             )
-            session.add(metadata)
-            insert_count += 1
-            seen_csv_pairs.add(pair)
-
-        try:
-            session.commit()
             print(f"\n Migration completed.")
-            print(f" Records inserted: {insert_count}")
+            print(f" Records stored  : {stored_count}")
             print(f" Records skipped : {skip_count}")
 
             if os.path.exists(csv_path):
@@ -174,95 +237,17 @@ def insert_judgments_from_csv_with_benches(csv_path: str, high_court_name: str,
     session: Session = SessionLocal()
 
     try:
-        # Ensure High Court with given bench exists
-        highcourt = (
-            session.query(HighCourt)
-            .filter(
-                HighCourt.highcourt_name == high_court_name,
-                HighCourt.bench == bench_name
-            )
-            .first()
-        )
-        if not highcourt:
-            highcourt = HighCourt(
-                highcourt_name=high_court_name,
+        try:
+            stored_count, skip_count = insert_judgment_rows(
+                session,
+                df.drop(columns=["bench"]).to_dict("records"),
+                high_court_name=high_court_name,
                 base_link=base_link,
-                bench=bench_name,
-                pdf_folder=pdf_folder
-            )
-            session.add(highcourt)
-            session.commit()
-            session.refresh(highcourt)
-            print(f"Added new High Court Bench: {high_court_name} ({bench_name})")
-
-        # Load existing (case_id, document_link) pairs for this bench
-        rows = (
-            session.query(MetaData.case_id, MetaData.document_link)
-            .filter_by(high_court_id=highcourt.id)
-            .all()
-        )
-        existing_pairs: set[tuple[str, str]] = set()
-        for row in rows:
-            links = []
-            if row.document_link:
-                if isinstance(row.document_link, str):
-                    try:
-                        links = json.loads(row.document_link)
-                    except Exception:
-                        links = [row.document_link]
-                elif isinstance(row.document_link, list):
-                    links = row.document_link
-            for link in links:
-                existing_pairs.add((row.case_id, link))
-
-        insert_count = 0
-        skip_count = 0
-        seen_csv_pairs = set()
-
-        for idx, row in df.iterrows():
-            case_id = str(row['case_no']).strip() if pd.notna(row['case_no']) else None
-            raw_date = str(row['date']).strip() if pd.notna(row['date']) else None
-            party_detail = str(row['party']).strip() if pd.notna(row['party']) else None
-            document_link = str(row['pdf_link']).strip() if pd.notna(row['pdf_link']) else None
-
-
-            if not all([case_id, raw_date, document_link]):
-                print(f"Row {idx} skipped: Missing fields.")
-                skip_count += 1
-                continue
-
-            # Normalize pair
-            pair = (case_id, document_link)
-
-            if pair in existing_pairs:
-                print(f"Row {idx} skipped: Already in DB (case_id={case_id}, link={document_link})")
-                skip_count += 1
-                continue
-
-            if pair in seen_csv_pairs:
-                print(f"Row {idx} skipped: Duplicate inside CSV (case_id={case_id}, link={document_link})")
-                skip_count += 1
-                continue
-
-            # Insert new row
-            metadata = MetaData(
-                high_court_id=highcourt.id,
-                case_id=case_id,
-                judgement_date=raw_date,
-                party_detail=party_detail,
-                document_link=json.dumps([document_link]),
-                scrapped_at=datetime.now(),
-                is_downloaded=False
+                pdf_folder=pdf_folder,
+                bench_name=bench_name,
             )
-            
-            session.add(metadata)
-            insert_count += 1
-            seen_csv_pairs.add(pair)
-
-        try:
-            session.commit()
             print(f"\nMigration completed for bench '{bench_name}'.")
-            print(f"Records inserted: {insert_count}")
+            print(f"Records stored  : {stored_count}")
             print(f"Records skipped : {skip_count}")
 
             # if os.path.exists(csv_path):
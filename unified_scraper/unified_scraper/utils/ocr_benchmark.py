@@ -0,0 +1,91 @@
+"""
+OCR engine benchmark on a folder of judgment PDFs. Every page is OCR'd (text
+layers are ignored) so the engines do the same work:
+
+    legacy  pdf2image at 300 DPI + pytesseract.image_to_string per page (the old PHHC path)
+    page    fitz render + one pytesseract call per page, adaptive DPI
+    batch   fitz render + one tesseract process per document and DPI, adaptive DPI
+
+    python -m unified_scraper.utils.ocr_benchmark pdfs
+    python -m unified_scraper.utils.ocr_benchmark pdfs --engines batch page --max-pages 5
+"""
+import os
+import time
+import argparse
+import statistics
+import fitz
+import pytesseract
+from pdf2image import convert_from_path
+from unified_scraper.utils.text_extraction import OCR_CONFIG, ocr_document_pages
+
+ENGINES = ("legacy", "page", "batch")
+
+
+def load_pdfs(pdf_dir):
+    return [
+        os.path.join(pdf_dir, name)
+        for name in sorted(os.listdir(pdf_dir))
+        if name.lower().endswith(".pdf")
+    ]
+
+
+def ocr_legacy(pdf_path, max_pages):
+    images = convert_from_path(pdf_path, dpi=300, last_page=max_pages)
+    return "\n".join(pytesseract.image_to_string(image) for image in images), len(images)
+
+
+def ocr_fitz(pdf_path, max_pages, engine):
+    with fitz.open(pdf_path) as pdf_doc:
+        indexes = list(range(min(pdf_doc.page_count, max_pages or pdf_doc.page_count)))
+        pages = ocr_document_pages(pdf_doc, indexes, {**OCR_CONFIG, "engine": engine})
+    return "\n".join(text for text, _, _ in pages), len(indexes)
+
+
+def run_engine(engine, pdf_paths, max_pages):
+    seconds, page_count, chars = [], 0, 0
+    for pdf_path in pdf_paths:
+        started = time.perf_counter()
+        if engine == "legacy":
+            text, pages = ocr_legacy(pdf_path, max_pages)
+        else:
+            text, pages = ocr_fitz(pdf_path, max_pages, engine)
+        seconds.append(time.perf_counter() - started)
+        page_count += pages
+        chars += len(text)
+    return {
+        "documents": len(pdf_paths),
+        "pages": page_count,
+        "chars": chars,
+        "total": sum(seconds),
+        "mean": statistics.mean(seconds) if seconds else 0.0,
+    }
+
+
+def print_report(name, result):
+    pages_per_second = result["pages"] / result["total"] if result["total"] else 0.0
+    print(
+        f"{name:<8} {result['documents']} docs  {result['pages']} pages  "
+        f"total {result['total']:8.1f} s  per doc {result['mean']:6.2f} s  "
+        f"{pages_per_second:6.2f} pages/s  {result['chars']} chars"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR engines on a folder of PDFs.")
+    parser.add_argument("pdf_dir")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--max-pages", type=int, default=0, help="OCR at most this many pages per PDF (0 = all)")
+    args = parser.parse_args()
+
+    pdf_paths = load_pdfs(args.pdf_dir)
+    if not pdf_paths:
+        print(f"No PDFs found in {args.pdf_dir}")
+        return
+
+    print(f"{len(pdf_paths)} PDFs from {args.pdf_dir}")
+    for engine in args.engines:
+        print_report(engine, run_engine(engine, pdf_paths, args.max_pages or None))
+
+
+if __name__ == "__main__":
+    main()
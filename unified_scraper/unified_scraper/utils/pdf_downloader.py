@@ -1,11 +1,24 @@
+import io
 import os
 import re
-import requests
-import fitz 
+import time
 from datetime import datetime
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
-from Database.models import MetaData,HighCourt
+from Database.models import (
+    MetaData,
+    HighCourt,
+    Document,
+    DOCUMENT_PENDING,
+    DOCUMENT_FAILED,
+    DOCUMENT_UPLOADED,
+    MAX_DOCUMENT_ATTEMPTS,
+)
 import json
+from collections import namedtuple
+from unified_scraper.utils.async_downloader import DOWNLOAD_CONFIG, download_documents
+from unified_scraper.utils.content_store import ContentStore
+from unified_scraper.utils.text_extraction import extract_text, txt_path_for
 
 
 def sanitize_filename(name: str) -> str:
@@ -26,10 +39,17 @@ def parse_links(raw):
         
         return [raw.strip()]
 
-def get_pending_pdfs(session: Session, high_court_name: str, bench_name:str):
+PendingDocument = namedtuple("PendingDocument", "document_id document_link id case_id date bench")
+
+
+def iter_pending_pdfs(session: Session, high_court_name: str, bench_name: str, batch_size: int = 500):
     """
-    Retrieve all rows where is_downloaded = False for a specific High Court.
-    Expands JSON document_link into multiple items (one per PDF link).
+    Yield batches (lists of PendingDocument tuples) of the documents of a specific
+    High Court that still have to be downloaded: pending ones, and failed ones with
+    attempts left. Keyset pagination on the (high_court_id, status, id) index keeps
+    every query a short range scan, so the first batch is available immediately and
+    memory stays bounded however large the backlog is. Documents that fail while
+    the batches are being consumed are left for the next run.
     """
     # Get HighCourt ID
     highcourt = (
@@ -41,81 +61,233 @@ def get_pending_pdfs(session: Session, high_court_name: str, bench_name:str):
     .first()
 )
     if not highcourt:
-        return []
- 
-    pending = (
-        session.query(MetaData)
-        .filter(
-            MetaData.is_downloaded == False,
-            MetaData.high_court_id == highcourt.id
-        )
-        .all()
-    ) 
-
-    results = []
-    for row in pending:
-        links = parse_links(row.document_link)
-        for link in links:
-            results.append({
-                "document_link": link,
-                "case_id": row.case_id,
-                "id": row.id,
-                "date": row.judgement_date,
-                "bench":bench_name
-            })
-    return results
-
-
-
-def pdf_to_txt(pdf_path):
+        return
+
+    started_at = session.query(func.now()).scalar()
+    for status in (DOCUMENT_PENDING, DOCUMENT_FAILED):
+        last_id = 0
+        while True:
+            query = (
+                session.query(
+                    Document.id,
+                    Document.url,
+                    Document.metadata_id,
+                    MetaData.case_id,
+                    MetaData.judgement_date,
+                )
+                .join(MetaData, MetaData.id == Document.metadata_id)
+                .filter(
+                    Document.high_court_id == highcourt.id,
+                    Document.status == status,
+                    Document.id > last_id,
+                    Document.attempts < MAX_DOCUMENT_ATTEMPTS
+                )
+            )
+            if status == DOCUMENT_FAILED:
+                query = query.filter(Document.updated_at < started_at)
+            rows = query.order_by(Document.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            yield [PendingDocument(*row, bench_name) for row in rows]
+
+
+def iter_new_pending_pdfs(session: Session, high_court_name: str, bench_name: str, seen, batch_size: int = 500):
     """
-    Convert a PDF file to TXT and save in the same directory.
+    One pass of iter_pending_pdfs that skips the documents in `seen` (ids already
+    yielded in this run, possibly still on their way to storage) and adds the
+    ones it yields.
     """
-    txt_path = os.path.splitext(pdf_path)[0] + ".txt"
-    try:
-        with fitz.open(pdf_path) as pdf_doc:
-            text_content = ""
-            for page in pdf_doc:
-                text_content += page.get_text()
+    # end the session's read snapshot, or rows committed since it began stay invisible
+    session.commit()
+    for batch in iter_pending_pdfs(session, high_court_name, bench_name, batch_size):
+        batch = [item for item in batch if item.document_id not in seen]
+        if batch:
+            seen.update(item.document_id for item in batch)
+            yield batch
 
-        with open(txt_path, "w", encoding="utf-8") as txt_file:
-            txt_file.write(text_content)
 
+def follow_pending_pdfs(session: Session, high_court_name: str, bench_name: str, crawling,
+                        batch_size: int = 500, poll_seconds: float = 30, wait=time.sleep):
+    """
+    Like iter_pending_pdfs, for while the crawl is still inserting documents:
+    passes repeat as long as `crawling()` is true, yielding each document once,
+    and `wait(poll_seconds)` when a pass finds nothing new. A last pass runs
+    after the crawl has ended.
+    """
+    seen = set()
+    while True:
+        finished = not crawling()
+        found = False
+        for batch in iter_new_pending_pdfs(session, high_court_name, bench_name, seen, batch_size):
+            found = True
+            yield batch
+        if finished:
+            return
+        if not found:
+            wait(poll_seconds)
+
+
+def mark_download_failed(session: Session, document_id):
+    """Count a failed attempt; the document stays in the pending query until MAX_DOCUMENT_ATTEMPTS."""
+    if session is None or document_id is None:
+        return
+    try:
+        session.query(Document).filter(Document.id == document_id).update({
+            "status": DOCUMENT_FAILED,
+            "attempts": Document.attempts + 1,
+        })
+        session.commit()
     except Exception as e:
-        print(f"Failed to convert {pdf_path} to TXT: {e}")
+        session.rollback()
+        print(f"Failed to record download failure for document {document_id}: {e}")
+
+
+def mark_uploaded_batch(session: Session, uploads):
+    """
+    Record a batch of uploaded documents with one bulk UPDATE, then flag the
+    MetaData rows none of whose documents is left to upload, in one statement.
+    `uploads` is a list of (item, blob_path, content_hash, size_bytes), the hash and
+    size being those of the blob (after any recompression). The caller commits.
+    """
+    if not uploads:
+        return
+    session.execute(update(Document), [
+        {
+            "id": item["document_id"],
+            "status": DOCUMENT_UPLOADED,
+            "blob_path": blob_path,
+            "content_hash": content_hash,
+            "size_bytes": size_bytes,
+        }
+        for item, blob_path, content_hash, size_bytes in uploads
+    ])
+    remaining = (
+        select(Document.id)
+        .where(Document.metadata_id == MetaData.id, Document.status != DOCUMENT_UPLOADED)
+        .exists()
+    )
+    session.execute(
+        update(MetaData)
+        .where(MetaData.id.in_({item["id"] for item, _, _, _ in uploads}), ~remaining)
+        .values(is_downloaded=True)
+        .execution_options(synchronize_session=False)
+    )
 
 
-def download_and_update(session: Session, pdf_items, output_root_folder):
+def extract_downloaded_text(result, text_stage=None):
+    """
+    Start text extraction for a downloaded document: in the background when there
+    is a `text_stage`, otherwise right away. A document held in memory is passed
+    as bytes; its text comes back in the result (see attach_extracted_text).
+    Returns the result when it was extracted right away, else None.
+    """
+    data = None
+    if result.buffer is not None:
+        result.buffer.seek(0)
+        data = result.buffer.read()
+    if text_stage:
+        # extracted in the background while the next batch downloads
+        text_stage.submit(result.path, data=data)
+        return None
+    return extract_text(result.path, data=data)
+
+
+def attach_extracted_text(downloaded_files, results):
+    """
+    Zero-disk mode: hand text extracted in memory, and the PDF if it was
+    recompressed, to the uploader, and drop them from `results`.
+    """
+    texts = {r["pdf_path"]: r.pop("text") for r in results if "text" in r}
+    pdfs = {r["pdf_path"]: r.pop("pdf_data") for r in results if "pdf_data" in r}
+    for item in downloaded_files:
+        if item["pdf_path"] in texts:
+            item["text"] = texts[item["pdf_path"]]
+        # repeats of a URL carry no buffer of their own (see AsyncPdfDownloader.download_all)
+        if item["pdf_path"] in pdfs and item.get("buffer") is not None:
+            item["buffer"].close()
+            item["buffer"] = io.BytesIO(pdfs[item["pdf_path"]])
+
+
+def split_downloaded(pdf_items, done, text_stage=None):
+    """
+    Resume support: split a batch of pending documents into those still to
+    download and the files an earlier attempt of this run already downloaded
+    (`done` is the run manifest's "download" items, still on disk). A file whose
+    TXT never got written is queued for extraction again.
+    Returns (items to download, downloaded files).
+    """
+    todo, downloaded_files = [], []
+    for item in pdf_items:
+        downloaded = done.get(str(item.document_id))
+        if downloaded is None or not os.path.exists(downloaded["pdf_path"]):
+            todo.append(item)
+            continue
+        if not os.path.exists(txt_path_for(downloaded["pdf_path"])):
+            if text_stage:
+                text_stage.submit(downloaded["pdf_path"])
+            else:
+                extract_text(downloaded["pdf_path"])
+        downloaded_files.append(downloaded)
+    return todo, downloaded_files
+
+
+def record_downloads(manifest, downloaded_files):
+    """Record a batch's files in the run manifest, so a rerun does not download them again."""
+    manifest.mark_items("download", [
+        (item["document_id"], {key: value for key, value in item.items() if key not in ("buffer", "text")})
+        for item in downloaded_files
+    ])
+
+
+def download_and_update(session: Session, pdf_items, output_root_folder, seen_urls=None, text_stage=None):
     today = datetime.today()
     month, day = today.strftime("%m"), today.strftime("%d")
 
     folder_path = os.path.join(output_root_folder, month, day, "delhc")
-    os.makedirs(folder_path, exist_ok=True)
+    if not DOWNLOAD_CONFIG["inMemory"]:
+        os.makedirs(folder_path, exist_ok=True)
 
-    downloaded_files = []
-
-    for i, item in enumerate(pdf_items, start=1):
-        try:
-            response = requests.get(item["document_link"], timeout=10)
-            response.raise_for_status()
+    jobs = []
+    for item in pdf_items:
+        # one file (and blob) per document: a case can have several, in any batch
+        file_path = os.path.join(folder_path, f"{sanitize_filename(item.case_id)}_{item.document_id}.pdf")
+        jobs.append((item, file_path, None))
+    results, stats = download_documents(jobs, seen_urls=seen_urls)
+    print(f"Download batch finished: {stats}")
 
-            safe_filename = sanitize_filename(item["case_id"]) + ".pdf"
-            file_path = os.path.join(folder_path, safe_filename)
-
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
+    # content already in storage (or converted earlier in this batch) needs no text extraction
+    content_store = ContentStore(session=session)
+    converted = set()
+    downloaded_files = []
 
-            print(f"[{i}] Downloaded: {item['document_link']} → {file_path}")
+    for i, result in enumerate(results, start=1):
+        item, file_path, sha256, size, error, buffer = result
+        if error is not None:
+            print(f"[{i}] Failed: {item.document_link} ({error})")
+            mark_download_failed(session, item.document_id)
+            continue
 
-            pdf_to_txt(file_path)
+        print(f"[{i}] Downloaded: {item.document_link} → {file_path}")
 
-            downloaded_files.append({
-                "id": item["id"],
-                "case_id": item["case_id"],
-                "pdf_path": file_path
-            })
+        downloaded = {
+            "document_id": item.document_id,
+            "id": item.id,
+            "case_id": item.case_id,
+            "pdf_path": file_path,
+            "content_hash": sha256,
+            "size_bytes": size,
+            "buffer": buffer,
+        }
+        if sha256 in converted or content_store.find(sha256):
+            print(f"[{i}] Same content already processed, skipping text extraction")
+        else:
+            extracted = extract_downloaded_text(result, text_stage)
+            if extracted:
+                attach_extracted_text([downloaded], [extracted])
+            converted.add(sha256)
 
-        except Exception as e:
-            print(f"[{i}] Failed: {item['document_link']} ({e})")
+        downloaded_files.append(downloaded)
 
+    content_store.close()
     return downloaded_files
@@ -0,0 +1,26 @@
+import logging
+
+CRAWL_LOG = "crawl.log"
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+def configure_logging(log_file=CRAWL_LOG, level=logging.INFO):
+    """
+    Append the pipeline's logging, and the log of the spiders it runs in-process,
+    to `log_file`. Called from a pipeline's entry point rather than at import, so
+    importing a pipeline (as the orchestrator does) configures nothing.
+    """
+    logging.basicConfig(filename=log_file, filemode="a", format=LOG_FORMAT, level=level, force=True)
+
+
+def run_summary(court, manifest, downloaded_files=None, error=None, spiders=()):
+    """What a pipeline's main() returns: one entry of the orchestrator's report."""
+    return {
+        "court": court,
+        "run_id": manifest.run_id,
+        "status": "failed" if error else "finished",
+        "error": str(error) if error else None,
+        "downloaded": len(downloaded_files or []),
+        "spiders": {job.name: job.summary() for job in spiders},
+        **manifest.progress(),
+    }
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+
+RUN_MANIFEST_FILE = os.getenv("RUN_MANIFEST_FILE", "run_manifest.sqlite")
+
+
+class RunManifest:
+    """
+    Durable record of a court pipeline run: which stages finished and, within a
+    stage, which items did (crawl slices, downloaded documents). It lives in
+    RUN_MANIFEST_FILE (SQLite) so that a run which dies can be picked up again:
+    opening the manifest for a court resumes its last unfinished run, unless that
+    is older than `max_age`, and the rerun skips everything recorded in it.
+
+    Spiders crawling on behalf of a pipeline run get its `run_id` as an argument
+    and open the same run; every write is committed straight away.
+    """
+
+    def __init__(self, court, path=RUN_MANIFEST_FILE, run_id=None, max_age=3 * 86400):
+        self.court = court
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(path or ":memory:", timeout=30)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY, court TEXT NOT NULL, started_at REAL, finished_at REAL, status TEXT);"
+            "CREATE TABLE IF NOT EXISTS stages ("
+            " run_id TEXT, stage TEXT, finished_at REAL, PRIMARY KEY (run_id, stage));"
+            "CREATE TABLE IF NOT EXISTS items ("
+            " run_id TEXT, stage TEXT, key TEXT, data TEXT, done_at REAL, PRIMARY KEY (run_id, stage, key));"
+        )
+        self.resumed = False
+        if run_id:
+            self.run_id = run_id
+            self.db.execute(
+                "INSERT OR IGNORE INTO runs (run_id, court, started_at, status) VALUES (?, ?, ?, 'running')",
+                (run_id, court, time.time()),
+            )
+        else:
+            self.run_id = self._resume(max_age) or self._start()
+        self.db.commit()
+
+    def _resume(self, max_age):
+        row = self.db.execute(
+            "SELECT run_id, started_at FROM runs WHERE court = ? AND finished_at IS NULL "
+            "ORDER BY started_at DESC LIMIT 1",
+            (self.court,),
+        ).fetchone()
+        if row and time.time() - row[1] < max_age:
+            self.resumed = True
+            self.logger.info(f"Resuming run {row[0]} of {self.court}")
+            return row[0]
+        return None
+
+    def _start(self):
+        now = time.time()
+        # an older run that never finished is not picked up any more
+        self.db.execute(
+            "UPDATE runs SET finished_at = ?, status = 'abandoned' WHERE court = ? AND finished_at IS NULL",
+            (now, self.court),
+        )
+        run_id = f"{self.court}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{uuid.uuid4().hex[:6]}"
+        self.db.execute(
+            "INSERT INTO runs (run_id, court, started_at, status) VALUES (?, ?, ?, 'running')",
+            (run_id, self.court, now),
+        )
+        self.logger.info(f"Started run {run_id}")
+        return run_id
+
+    def stage_done(self, stage):
+        return self.db.execute(
+            "SELECT 1 FROM stages WHERE run_id = ? AND stage = ?", (self.run_id, stage)
+        ).fetchone() is not None
+
+    def finish_stage(self, stage):
+        self.db.execute(
+            "INSERT OR REPLACE INTO stages (run_id, stage, finished_at) VALUES (?, ?, ?)",
+            (self.run_id, stage, time.time()),
+        )
+        self.db.commit()
+
+    def mark_items(self, stage, items):
+        """Record finished items of a stage; `items` is an iterable of (key, data) with JSON-able data."""
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO items (run_id, stage, key, data, done_at) VALUES (?, ?, ?, ?, ?)",
+            [(self.run_id, stage, str(key), json.dumps(data), now) for key, data in items],
+        )
+        self.db.commit()
+
+    def mark_item(self, stage, key, data=None):
+        self.mark_items(stage, [(key, data)])
+
+    def done_keys(self, stage):
+        return {
+            key for (key,) in self.db.execute(
+                "SELECT key FROM items WHERE run_id = ? AND stage = ?", (self.run_id, stage)
+            )
+        }
+
+    def items(self, stage):
+        """{key: data} of the finished items of a stage."""
+        return {
+            key: json.loads(data) for key, data in self.db.execute(
+                "SELECT key, data FROM items WHERE run_id = ? AND stage = ? ORDER BY done_at", (self.run_id, stage)
+            )
+        }
+
+    def progress(self):
+        stages = [stage for (stage,) in self.db.execute(
+            "SELECT stage FROM stages WHERE run_id = ? ORDER BY finished_at", (self.run_id,)
+        )]
+        counts = dict(self.db.execute(
+            "SELECT stage, COUNT(*) FROM items WHERE run_id = ? GROUP BY stage", (self.run_id,)
+        ).fetchall())
+        return {"stages_done": stages, "items_done": counts}
+
+    def is_finished(self):
+        row = self.db.execute("SELECT finished_at FROM runs WHERE run_id = ?", (self.run_id,)).fetchone()
+        return row is not None and row[0] is not None
+
+    def finish(self, status="finished"):
+        self.db.execute(
+            "UPDATE runs SET finished_at = ?, status = ? WHERE run_id = ?", (time.time(), status, self.run_id)
+        )
+        self.db.commit()
+        self.logger.info(f"Run {self.run_id} {status}: {self.progress()}")
+
+    def close(self):
+        self.db.close()
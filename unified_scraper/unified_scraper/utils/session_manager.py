@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import logging
+from http.cookies import SimpleCookie
+
+SESSION_STORE_FILE = os.getenv("SESSION_STORE_FILE", "captcha_sessions.json")
+
+
+def cookies_from_headers(set_cookie_headers):
+    """Turn raw Set-Cookie header values (bytes or str) into a {name: value} dict."""
+    cookies = {}
+    for header in set_cookie_headers:
+        if isinstance(header, bytes):
+            header = header.decode("latin-1")
+        parsed = SimpleCookie()
+        try:
+            parsed.load(header)
+        except Exception:
+            continue
+        cookies.update({name: morsel.value for name, morsel in parsed.items()})
+    return cookies
+
+
+class CaptchaSessionManager:
+    """
+    Keeps one solved session per court (cookies, CSRF/form tokens, captcha text)
+    and hands it out for as long as the court keeps accepting it. Callers report
+    expiry with `invalidate` when a response comes back as a captcha form or a
+    CSRF error, and only then solve again.
+
+    Some courts verify the captcha per request rather than per session. If a
+    freshly solved session is rejected before it served a single extra request,
+    that counts as a strike. After `max_strikes` the court is marked not
+    reusable, and callers go back to one captcha per request (re-checked after
+    `recheck_after` seconds). Sessions and the reusable flag are persisted in
+    SESSION_STORE_FILE between runs; a stored session is dropped after `max_age`
+    seconds, or `max_ages[court]` (the CAPTCHA_SESSION_MAX_AGE setting).
+    """
+
+    def __init__(self, path=SESSION_STORE_FILE, max_age=3600, max_strikes=2, recheck_after=7 * 86400,
+                 crawler_stats=None, max_ages=None):
+        self.path = path
+        self.max_age = max_age
+        self.max_ages = dict(max_ages or {})
+        self.max_strikes = max_strikes
+        self.recheck_after = recheck_after
+        self.crawler_stats = crawler_stats
+        self.logger = logging.getLogger(__name__)
+        self.courts = self._load()
+        self.versions = {}
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.courts, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _court(self, court):
+        return self.courts.setdefault(court, {"session": None, "reusable": True, "strikes": 0})
+
+    def _inc(self, court, key):
+        if self.crawler_stats:
+            self.crawler_stats.inc_value(f"sessions/{court}/{key}")
+
+    def reusable(self, court):
+        entry = self._court(court)
+        if not entry["reusable"] and time.time() - entry.get("disabled_at", 0) > self.recheck_after:
+            # the court may have changed its behaviour, try reuse again
+            entry.update(reusable=True, strikes=0)
+        return entry["reusable"]
+
+    def version(self, court):
+        """Bumped on every store; lets in-flight requests tell whether the session changed under them."""
+        return self.versions.get(court, 0)
+
+    def get(self, court):
+        """The live session dict for `court`, or None if there is none or it is too old."""
+        session = self._court(court)["session"]
+        max_age = int(self.max_ages.get(court, self.max_age))
+        if session and time.time() - session["solved_at"] > max_age:
+            self.logger.info(f"[{court}] Stored session is older than {max_age}s, dropping it")
+            self._court(court)["session"] = None
+            return None
+        return session
+
+    def cookies(self, court):
+        session = self.get(court)
+        return dict(session["cookies"]) if session else {}
+
+    def cookie_header(self, court):
+        cookies = self.cookies(court)
+        if not cookies:
+            return {}
+        return {"Cookie": "; ".join(f"{name}={value}" for name, value in cookies.items())}
+
+    def store(self, court, cookies, **state):
+        """Record a freshly solved session: its cookies plus form state (tokens, captcha)."""
+        self._court(court)["session"] = {
+            "cookies": dict(cookies),
+            "state": state,
+            "solved_at": time.time(),
+            "uses": 0,
+        }
+        self.versions[court] = self.version(court) + 1
+        self._inc(court, "solved")
+
+    def touch(self, court):
+        """A request was served by the stored session without a new captcha."""
+        session = self._court(court)["session"]
+        if session:
+            session["uses"] += 1
+        self.report_reuse(court, True)
+
+    def invalidate(self, court, reason=""):
+        session = self._court(court)["session"]
+        if session is None:
+            return
+        self.logger.info(f"[{court}] Session expired after {session['uses']} reuses {reason}".rstrip())
+        self._court(court)["session"] = None
+        self.report_reuse(court, False, session["uses"])
+
+    def report_reuse(self, court, accepted, uses=0):
+        """
+        Verdict on reusing a session. Also used directly by spiders that keep
+        several sessions of their own (one per cookie jar) and only need the
+        per-court reusable flag and stats from the manager.
+        """
+        entry = self._court(court)
+        if accepted:
+            entry["strikes"] = 0
+            self._inc(court, "reused")
+            return
+
+        self._inc(court, "expired")
+        if uses == 0:
+            entry["strikes"] += 1
+            if entry["strikes"] >= self.max_strikes and entry["reusable"]:
+                entry["reusable"] = False
+                entry["disabled_at"] = time.time()
+                self.logger.warning(f"[{court}] Sessions are not reusable, solving a captcha per request")
@@ -0,0 +1,60 @@
+import os
+import zstandard
+
+STORAGE_CONFIG = {
+    # upload text as .txt.zst (Content-Encoding: zstd) instead of .txt
+    "compressText": os.getenv("COMPRESS_TEXT") == "1",
+    "zstdLevel": int(os.getenv("ZSTD_LEVEL", "10")),
+    # losslessly re-save PDFs through PyMuPDF when that makes them smaller
+    "recompressPdf": os.getenv("RECOMPRESS_PDF") == "1",
+    # keep the re-saved PDF only if it is at least this much smaller
+    "minPdfSaving": 0.05,
+}
+
+TEXT_CONTENT_TYPE = "text/plain; charset=utf-8"
+ZSTD_SUFFIX = ".zst"
+ZSTD_ENCODING = "zstd"
+
+
+def compress_text(data, config=STORAGE_CONFIG):
+    """zstd-compress encoded text. A compressor per call, so worker threads can share this."""
+    return zstandard.ZstdCompressor(level=config["zstdLevel"]).compress(data)
+
+
+def recompress_pdf(pdf_doc, original_size, config=STORAGE_CONFIG):
+    """
+    Re-save an open fitz document losslessly: unused and duplicate objects are
+    dropped and uncompressed streams, images and fonts deflated. Returns the new
+    bytes if they are at least `minPdfSaving` smaller than `original_size`, else
+    None (also when MuPDF cannot write the file, e.g. encrypted PDFs).
+
+    Not linearized: PyMuPDF 1.24+ no longer supports writing linearized PDFs.
+    """
+    try:
+        data = pdf_doc.tobytes(garbage=3, deflate=True, deflate_images=True, deflate_fonts=True)
+    except Exception:
+        return None
+    if len(data) <= original_size * (1 - config["minPdfSaving"]):
+        return data
+    return None
+
+
+class StorageStats:
+    """Bytes before and after the storage format, per kind of artifact ("pdf", "txt")."""
+
+    def __init__(self):
+        self.before = {}
+        self.after = {}
+
+    def record(self, kind, before, after):
+        self.before[kind] = self.before.get(kind, 0) + before
+        self.after[kind] = self.after.get(kind, 0) + after
+
+    def saved(self):
+        return sum(self.before.values()) - sum(self.after.values())
+
+    def summary(self):
+        return {
+            kind: f"{self.before[kind] / 1e6:.1f} MB -> {self.after[kind] / 1e6:.1f} MB"
+            for kind in self.before
+        }
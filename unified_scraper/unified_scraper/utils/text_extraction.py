@@ -0,0 +1,350 @@
+import io
+import os
+import csv
+import time
+import string
+import asyncio
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import fitz
+import pytesseract
+from PIL import Image
+from unified_scraper.utils.storage_format import STORAGE_CONFIG, recompress_pdf
+
+OCR_CONFIG = {
+    # a text layer shorter than this, or with more unreadable characters, is OCR'd
+    "minChars": 25,
+    "minReadableRatio": 0.8,
+    # rendered at the first DPI; re-rendered at the next only if confidence is poor
+    "dpis": (150, 300),
+    "minConfidence": 70,
+    "lang": "eng",
+    # "batch": one tesseract process per document and DPI (list-file mode)
+    # "page": one pytesseract call (= one process) per page
+    "engine": os.getenv("OCR_ENGINE", "batch"),
+}
+
+READABLE = set(string.ascii_letters + string.digits + string.punctuation + "₹§¶–—‘’“”•")
+
+
+def text_layer_usable(text, config=OCR_CONFIG):
+    """False for pages with no text layer or one that decodes to junk (broken font maps)."""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < config["minChars"]:
+        return False
+    readable = sum(c in READABLE or c.isalpha() for c in chars)
+    return readable / len(chars) >= config["minReadableRatio"]
+
+
+def ocr_image(image, config=OCR_CONFIG):
+    """Return (text, mean word confidence) for a PIL image, keeping tesseract's line breaks."""
+    data = pytesseract.image_to_data(image, lang=config["lang"], output_type=pytesseract.Output.DICT)
+    lines, confidences = {}, []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if not word.strip() or confidence < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
+def ocr_page(page, config=OCR_CONFIG):
+    """OCR one page, stepping up through `dpis` while confidence is below `minConfidence`."""
+    best = ("", 0.0, 0)
+    for dpi in config["dpis"]:
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+        text, confidence = ocr_image(image, config)
+        if confidence >= best[1]:
+            best = (text, confidence, dpi)
+        if confidence >= config["minConfidence"]:
+            break
+    return best
+
+
+def parse_tesseract_tsv(output, page_count):
+    """Split tesseract TSV output into [(text, mean word confidence)] per input image."""
+    pages = [({}, []) for _ in range(page_count)]
+    for row in csv.DictReader(io.StringIO(output), delimiter="\t", quoting=csv.QUOTE_NONE):
+        if row.get("level") != "5" or not (row.get("text") or "").strip():
+            continue
+        confidence = float(row["conf"])
+        index = int(row["page_num"]) - 1
+        if confidence < 0 or not 0 <= index < page_count:
+            continue
+        lines, confidences = pages[index]
+        key = (int(row["block_num"]), int(row["par_num"]), int(row["line_num"]))
+        lines.setdefault(key, []).append(row["text"])
+        confidences.append(confidence)
+    return [
+        (
+            "\n".join(" ".join(words) for _, words in sorted(lines.items())),
+            sum(confidences) / len(confidences) if confidences else 0.0,
+        )
+        for lines, confidences in pages
+    ]
+
+
+def ocr_pages_batch(pages, dpi, config=OCR_CONFIG):
+    """
+    OCR several fitz pages with a single tesseract process: each page is rendered
+    to a PNG in a temp dir (one page in memory at a time) and tesseract reads them
+    all from a list file, loading its model once. Returns [(text, confidence)].
+    """
+    with tempfile.TemporaryDirectory(prefix="ocr-") as temp_dir:
+        image_paths = []
+        for i, page in enumerate(pages):
+            image_path = os.path.join(temp_dir, f"{i:05d}.png")
+            page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).save(image_path)
+            image_paths.append(image_path)
+
+        list_path = os.path.join(temp_dir, "pages.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(image_paths) + "\n")
+
+        completed = subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd, list_path, "stdout",
+             "-l", config["lang"], "--dpi", str(dpi), "tsv"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return parse_tesseract_tsv(completed.stdout, len(pages))
+
+
+def ocr_document_pages(pdf_doc, indexes, config=OCR_CONFIG):
+    """
+    (text, confidence, dpi) for the given page indexes. With the batch engine the
+    pages are OCR'd together at the first DPI, and only the low-confidence ones
+    go through again at the next DPI.
+    """
+    if config["engine"] == "page":
+        return [ocr_page(pdf_doc[i], config) for i in indexes]
+
+    best = {i: ("", 0.0, 0) for i in indexes}
+    todo = list(indexes)
+    for dpi in config["dpis"]:
+        if not todo:
+            break
+        retry = []
+        for i, (text, confidence) in zip(todo, ocr_pages_batch([pdf_doc[i] for i in todo], dpi, config)):
+            if confidence >= best[i][1]:
+                best[i] = (text, confidence, dpi)
+            if confidence < config["minConfidence"]:
+                retry.append(i)
+        todo = retry
+    return [best[i] for i in indexes]
+
+
+def extract_pdf_text(pdf_doc, ocr=True, config=OCR_CONFIG):
+    """
+    Text of an open fitz document, page by page: the text layer when it is usable,
+    OCR otherwise (when `ocr` is set). Returns (text, pages) where pages records
+    per page the method used ("text", "ocr" or "empty"), the DPI and confidence.
+    """
+    texts, pages, needs_ocr = [], [], []
+    for number, page in enumerate(pdf_doc, start=1):
+        text = page.get_text()
+        info = {"page": number, "method": "text"}
+        if not text_layer_usable(text, config):
+            if ocr:
+                needs_ocr.append(number - 1)
+            elif not text.strip():
+                info["method"] = "empty"
+        texts.append(text)
+        pages.append(info)
+
+    if needs_ocr:
+        for i, (text, confidence, dpi) in zip(needs_ocr, ocr_document_pages(pdf_doc, needs_ocr, config)):
+            texts[i] = text
+            pages[i].update(method="ocr", dpi=dpi, confidence=round(confidence, 1))
+
+    return "".join(text if text.endswith("\n") else text + "\n" for text in texts), pages
+
+
+def method_counts(pages):
+    counts = {}
+    for info in pages:
+        counts[info["method"]] = counts.get(info["method"], 0) + 1
+    return counts
+
+
+def txt_path_for(pdf_path):
+    return os.path.splitext(pdf_path)[0] + ".txt"
+
+
+def write_text_atomic(path, text):
+    """Write `text` to a temp file and rename it, so a reader never sees half a file."""
+    write_bytes_atomic(path, text.encode("utf-8"))
+
+
+def write_bytes_atomic(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def extract_text(pdf_path, ocr=False, data=None, recompress=STORAGE_CONFIG["recompressPdf"]):
+    """
+    Convert a PDF file to TXT next to it. Runs in a worker process, so it only
+    takes and returns plain values: a dict with the paths, page count, per-page
+    methods and timing. With `ocr`, pages without a usable text layer are OCR'd.
+
+    Given the PDF's bytes as `data` (zero-disk mode) nothing is read or written:
+    `pdf_path` is only its name and the text is returned under "text".
+
+    With `recompress` the already open PDF is also re-saved losslessly, replacing
+    the file (or returned as "pdf_data") when that makes it smaller.
+    """
+    started = time.perf_counter()
+    result = {"pdf_path": pdf_path, "txt_path": txt_path_for(pdf_path), "pages": 0, "error": None}
+    try:
+        source = {"stream": data, "filetype": "pdf"} if data is not None else {"filename": pdf_path}
+        smaller = None
+        with fitz.open(**source) as pdf_doc:
+            text_content, pages = extract_pdf_text(pdf_doc, ocr=ocr)
+            result["pages"] = pdf_doc.page_count
+            if recompress:
+                original_size = len(data) if data is not None else os.path.getsize(pdf_path)
+                smaller = recompress_pdf(pdf_doc, original_size)
+        if smaller is not None:
+            result["pdf_bytes_saved"] = original_size - len(smaller)
+        if data is not None:
+            result["text"] = text_content
+            if smaller is not None:
+                result["pdf_data"] = smaller
+        else:
+            write_text_atomic(result["txt_path"], text_content)
+            if smaller is not None:
+                write_bytes_atomic(pdf_path, smaller)
+        result["chars"] = len(text_content)
+        result["methods"] = method_counts(pages)
+        result["page_details"] = pages
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class TextExtractionStage:
+    """
+    Text extraction for downloaded PDFs on a process pool, one worker per core by
+    default. Downloaders `submit` each file as soon as it is on disk and carry on;
+    `wait` blocks until every submitted file is converted (call it before
+    uploading) and returns the per-file results.
+
+    At most `max_pending` files are queued or in progress. Beyond that `submit`
+    blocks, and `submit_async` (for Scrapy callbacks) waits without blocking the
+    event loop, so a fast crawl cannot pile up unbounded work. Async submitters
+    wait their turn on a thread of the stage's own, not in asyncio's default
+    executor, which the spiders need for their HTTP and captcha calls.
+
+    Both return the file's future; `wait_for` waits for some of them only (one
+    batch), so an uploader can take each batch while later ones are converted.
+    Submitting and waiting may happen on different threads.
+    """
+
+    def __init__(self, workers=None, extractor=extract_text, max_pending=None):
+        self.workers = workers or int(os.getenv("TEXT_EXTRACTION_WORKERS", "0")) or os.cpu_count()
+        self.extractor = extractor
+        self.logger = logging.getLogger(__name__)
+        self.pool = None
+        self.futures = set()
+        self.results = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self.submitter = None
+
+    def submit(self, pdf_path, data=None):
+        self.slots.acquire()
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            if data is not None:
+                future = self.pool.submit(self.extractor, pdf_path, data=data)
+            else:
+                future = self.pool.submit(self.extractor, pdf_path)
+            self.futures.add(future)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    async def submit_async(self, pdf_path, data=None):
+        """`submit` from a coroutine: waits for a free slot on the submitter thread, not on the loop."""
+        with self.lock:
+            if self.submitter is None:
+                # one thread: however many callbacks wait, only it is ever blocked on a slot
+                self.submitter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="text-submit")
+        return await asyncio.get_running_loop().run_in_executor(self.submitter, self.submit, pdf_path, data)
+
+    @staticmethod
+    def _result(future):
+        try:
+            return future.result()
+        except Exception as e:
+            # the worker itself died (e.g. a crash inside MuPDF)
+            return {"pdf_path": None, "error": str(e), "seconds": 0.0, "pages": 0}
+
+    def _collect(self, future):
+        result = self._result(future)
+        if result["error"]:
+            self.logger.error(f"Failed to convert {result['pdf_path']} to TXT: {result['error']}")
+        else:
+            where = "in memory" if "text" in result else f"saved: {result['txt_path']}"
+            self.logger.info(
+                f"TXT {where} ({result['pages']} pages {result['methods']}, {result['seconds']:.2f}s)"
+            )
+        self.results.append(result)
+        return result
+
+    def wait_for(self, futures):
+        """Wait for the given futures of this stage and return their results."""
+        results = []
+        for future in as_completed(futures):
+            with self.lock:
+                # each result is logged and counted once, by whichever wait gets it first
+                first = future in self.futures
+                self.futures.discard(future)
+            results.append(self._collect(future) if first else self._result(future))
+        return results
+
+    def wait(self):
+        with self.lock:
+            futures = list(self.futures)
+        self.wait_for(futures)
+        return self.results
+
+    def summary(self):
+        converted = [r for r in self.results if not r["error"]]
+        seconds = [r["seconds"] for r in converted]
+        return {
+            "files": len(converted),
+            "failed": len(self.results) - len(converted),
+            "pages": sum(r["pages"] for r in converted),
+            "cpu_seconds": round(sum(seconds), 1),
+            "slowest": max(seconds, default=0.0),
+            "pdf_bytes_saved": sum(r.get("pdf_bytes_saved", 0) for r in converted),
+        }
+
+    def close(self):
+        if self.submitter is not None:
+            self.submitter.shutdown()
+            self.submitter = None
+        self.wait()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.results:
+            self.logger.info(f"Text extraction: {self.summary()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
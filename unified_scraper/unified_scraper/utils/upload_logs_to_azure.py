@@ -1,17 +1,7 @@
 import os
 import datetime
-from azure.storage.blob import BlobServiceClient, ContentSettings
-from dotenv import load_dotenv
-
-load_dotenv()
-
-sas_url = os.getenv("SAS_URL")
-if not sas_url:
-    raise ValueError("SAS_URL environment variable is not set")
-
-account_url = sas_url.split('?')[0]
-sas_token = sas_url.split('?')[1]
-container_name = os.getenv("CONTAINER_NAME")
+from azure.storage.blob import ContentSettings
+from unified_scraper.utils.upload_to_azure import get_container_client
 
 
 def upload_crawl_log(local_log_path: str, user_choice: str):
@@ -34,8 +24,7 @@ def upload_crawl_log(local_log_path: str, user_choice: str):
     # Blob path -> year/month/day/user_choice/crawl_TIMESTAMP.log
     blob_log_path = f"{year}/{month}/{day}/{user_choice}/crawl_{timestamp}.log"
 
-    blob_service_client = BlobServiceClient(account_url=account_url, credential=sas_token)
-    container_client = blob_service_client.get_container_client(container=container_name)
+    container_client = get_container_client()
 
     print(f"Uploading crawl.log to Azure: {blob_log_path}")
 
@@ -1,10 +1,21 @@
 import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from azure.storage.blob import BlobServiceClient, ContentSettings
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from Database.models import MetaData
-import os
+from unified_scraper.utils.pdf_downloader import mark_uploaded_batch
+from unified_scraper.utils.content_store import ContentStore
+from unified_scraper.utils.storage_format import (
+    STORAGE_CONFIG,
+    TEXT_CONTENT_TYPE,
+    ZSTD_ENCODING,
+    ZSTD_SUFFIX,
+    StorageStats,
+    compress_text,
+)
 import shutil
+import hashlib
 
 load_dotenv()
 
@@ -16,75 +27,251 @@ account_url = sas_url.split('?')[0]
 sas_token = sas_url.split('?')[1]
 container_name = os.getenv('CONTAINER_NAME')
 
+UPLOAD_CONFIG = {
+    "workers": int(os.getenv("UPLOAD_WORKERS", "8")),
+    # parallel block uploads inside one large blob
+    "blobConcurrency": int(os.getenv("UPLOAD_BLOB_CONCURRENCY", "4")),
+    # documents marked uploaded per UPDATE/commit
+    "dbBatchSize": int(os.getenv("UPLOAD_DB_BATCH_SIZE", "200")),
+}
+
+
+@lru_cache(maxsize=None)
+def get_container_client():
+    """One client (and HTTP connection pool) per process, shared by every upload."""
+    blob_service_client = BlobServiceClient(account_url=account_url, credential=sas_token)
+    return blob_service_client.get_container_client(container=container_name)
+
+
+def blob_path_for(path, local_base):
+    relative_path = os.path.relpath(path, start=local_base).replace("\\", "/")
+    return f"{local_base}/{relative_path}"
+
+
+def stream_sha256(f, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    with open(path, "rb") as f:
+        return stream_sha256(f, chunk_size)
+
+
+def upload_data(container_client, data, blob_path, content_type, config=UPLOAD_CONFIG, content_encoding=None):
+    container_client.upload_blob(
+        name=blob_path,
+        data=data,
+        overwrite=True,
+        max_concurrency=config["blobConcurrency"],
+        content_settings=ContentSettings(content_type=content_type, content_encoding=content_encoding)
+    )
 
-def upload_to_azure(session: Session, downloaded_files,local_base):
+
+def upload_file(container_client, path, blob_path, content_type, config=UPLOAD_CONFIG):
+    with open(path, "rb") as data:
+        upload_data(container_client, data, blob_path, content_type, config)
+
+
+def has_pdf(item):
+    return item.get("buffer") is not None or os.path.exists(item["pdf_path"])
+
+
+def upload_text(container_client, item, txt_path, local_base, config=UPLOAD_CONFIG, storage_config=STORAGE_CONFIG):
+    """Upload the document's text, as .txt.zst when `compressText` is on. Returns (raw, stored) bytes."""
+    if item.get("text") is not None:
+        data = item["text"].encode("utf-8")
+    else:
+        with open(txt_path, "rb") as f:
+            data = f.read()
+    blob_txt_path = blob_path_for(txt_path, local_base)
+    if storage_config["compressText"]:
+        stored = compress_text(data, storage_config)
+        blob_txt_path += ZSTD_SUFFIX
+        print(f" Uploading TXT: {blob_txt_path}")
+        upload_data(container_client, stored, blob_txt_path, TEXT_CONTENT_TYPE, config, content_encoding=ZSTD_ENCODING)
+    else:
+        stored = data
+        print(f" Uploading TXT: {blob_txt_path}")
+        upload_data(container_client, stored, blob_txt_path, "text/plain", config)
+    return len(data), len(stored)
+
+
+def upload_document(container_client, item, local_base, config=UPLOAD_CONFIG):
     """
-    Uploads PDF and TXT files from downloaded_files list to Azure Blob Storage.
-    Marks the DB record is_downloaded=True only after PDF upload success.
-    
-    Args:
-        session (Session): SQLAlchemy DB session
-        downloaded_files (list of dict): Each dict must have 'id', 'case_id', 'pdf_path'
+    Upload one document's PDF and, if present, its TXT. Runs in a worker thread.
+    In zero-disk mode both come from memory: the PDF's spooled `buffer` and the
+    extracted `text`. Returns (blob path, files uploaded, [(kind, bytes before
+    storage format, bytes uploaded)], (SHA-256, size) of the uploaded PDF).
     """
+    pdf_path = item["pdf_path"]
+    blob_pdf_path = blob_path_for(pdf_path, local_base)
+    print(f" Uploading PDF: {blob_pdf_path}")
+    # recompression only ever replaces a PDF with a smaller one, so an unchanged
+    # size means the bytes are still the downloaded ones
+    if item.get("buffer") is not None:
+        pdf_size = item["buffer"].seek(0, os.SEEK_END)
+        item["buffer"].seek(0)
+        pdf_hash = item["content_hash"]
+        if pdf_size != item["size_bytes"]:
+            pdf_hash = stream_sha256(item["buffer"])
+            item["buffer"].seek(0)
+        upload_data(container_client, item["buffer"], blob_pdf_path, "application/pdf", config)
+    else:
+        pdf_size = os.path.getsize(pdf_path)
+        pdf_hash = item["content_hash"] if pdf_size == item["size_bytes"] else file_sha256(pdf_path)
+        upload_file(container_client, pdf_path, blob_pdf_path, "application/pdf", config)
+    uploaded = 1
+    # size_bytes is the size as downloaded, before any recompression
+    sizes = [("pdf", item["size_bytes"], pdf_size)]
 
-    blob_service_client = BlobServiceClient(account_url=account_url, credential=sas_token)
-    container_client = blob_service_client.get_container_client(container=container_name)
+    txt_path = os.path.splitext(pdf_path)[0] + ".txt"
+    if item.get("text") is not None or os.path.exists(txt_path):
+        try:
+            sizes.append(("txt", *upload_text(container_client, item, txt_path, local_base, config)))
+            uploaded += 1
+        except Exception as e:
+            print(f"Failed to upload TXT {txt_path}: {e}")
+    return blob_pdf_path, uploaded, sizes, (pdf_hash, pdf_size)
 
-    uploaded_count = 0
 
+def remove_local_files(downloaded_files):
+    """Delete the PDF and TXT files of a batch, leaving the rest of the folder alone."""
     for item in downloaded_files:
         pdf_path = item["pdf_path"]
-        if not os.path.exists(pdf_path):
-            print(f" PDF file not found: {pdf_path}, skipping.")
-            continue
+        for path in (pdf_path, os.path.splitext(pdf_path)[0] + ".txt"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Failed to delete {path}: {e}")
+
+
+def upload_to_azure(session: Session, downloaded_files,local_base, config=UPLOAD_CONFIG, remove_local_base=True):
+    """
+    Uploads PDF and TXT files from downloaded_files list to Azure Blob Storage.
+    Marks the document uploaded (blob path, SHA-256, size) only after PDF upload
+    success, and the MetaData record is_downloaded=True once all its documents are.
+    The SHA-256 and size are those of the blob, which differ from the download's
+    when the PDF was recompressed. PDFs whose downloaded content is already in the
+    container are not uploaded again (see ContentStore); their document points at
+    the existing blob instead. Documents of the batch with the same content are
+    uploaded once.
+
+    Items may carry the PDF in memory ('buffer', zero-disk mode) and its 'text';
+    both are released once the batch is done.
+
+    Files go up on a pool of `workers` threads sharing one client, and the DB
+    updates are written in batches of `dbBatchSize` documents.
+
+    Afterwards the whole `local_base` folder is deleted, or with
+    `remove_local_base=False` (while other batches are still being downloaded
+    into it) only this batch's files.
 
-        # Upload PDF
-        relative_pdf_path = os.path.relpath(pdf_path, start=local_base).replace("\\", "/")
-        blob_pdf_path = f"{local_base}/{relative_pdf_path}"
+    Args:
+        session (Session): SQLAlchemy DB session
+        downloaded_files (list of dict): Each dict must have 'document_id', 'id', 'case_id', 'pdf_path'
+    """
+
+    container_client = get_container_client()
+    content_store = ContentStore(session=session, container_client=container_client)
+
+    storage_stats = StorageStats()
+    uploaded_count = 0
+    reused_count = 0
+    failed_count = 0
+    pending_updates = []
 
-        print(f" Uploading PDF: {blob_pdf_path}")
+    def flush_updates():
+        nonlocal failed_count
+        if not pending_updates:
+            return
         try:
-            with open(pdf_path, "rb") as data:
-                container_client.upload_blob(
-                    name=blob_pdf_path,
-                    data=data,
-                    overwrite=True,
-                    content_settings=ContentSettings(content_type="application/pdf")
-                )
-            uploaded_count += 1
-
-            session.query(MetaData).filter(MetaData.id == item["id"]).update({"is_downloaded": True})
+            mark_uploaded_batch(session, pending_updates)
             session.commit()
+            # keyed by the download hash, which is what the next download is looked up by
+            for item, blob_path, content_hash, size_bytes in pending_updates:
+                content_store.add(item["content_hash"], blob_path, size_bytes, blob_sha256=content_hash)
         except Exception as e:
-            print(f" Failed to upload PDF {pdf_path}: {e}")
+            session.rollback()
+            failed_count += len(pending_updates)
+            print(f" Failed to record {len(pending_updates)} uploads in the database: {e}")
+        pending_updates.clear()
+
+    items = []
+    for item in downloaded_files:
+        # a hashed document may already be stored even if its file is gone
+        if not item.get("content_hash") and not has_pdf(item):
+            print(f" PDF file not found: {item['pdf_path']}, skipping.")
             continue
+        items.append(item)
+
+    with ThreadPoolExecutor(max_workers=config["workers"]) as pool:
+        # downloaders hash while streaming; the PHHC spider's items are hashed here
+        unhashed = [item for item in items if not item.get("content_hash")]
+        for item, content_hash in zip(unhashed, pool.map(lambda i: file_sha256(i["pdf_path"]), unhashed)):
+            item["content_hash"] = content_hash
+        for item in items:
+            item["size_bytes"] = item.get("size_bytes") or os.path.getsize(item["pdf_path"])
 
-        txt_path = os.path.splitext(pdf_path)[0] + ".txt"
-        if os.path.exists(txt_path):
-            relative_txt_path = os.path.relpath(txt_path, start=local_base).replace("\\", "/")
-            blob_txt_path = f"{local_base}/{relative_txt_path}"
+        stored = content_store.find_stored(item["content_hash"] for item in items)
 
-            print(f" Uploading TXT: {blob_txt_path}")
+        futures = {}
+        same_content = {}
+        for item in items:
+            if item["content_hash"] in stored:
+                existing_blob, blob_hash, blob_size = stored[item["content_hash"]]
+                print(f" Already stored as {existing_blob}, not uploading {item['pdf_path']}")
+                if blob_size is None and blob_hash == item["content_hash"]:
+                    blob_size = item["size_bytes"]
+                pending_updates.append((item, existing_blob, blob_hash, blob_size))
+                reused_count += 1
+            elif item["content_hash"] in same_content:
+                same_content[item["content_hash"]].append(item)
+            elif not has_pdf(item):
+                print(f" PDF file not found: {item['pdf_path']}, skipping.")
+            else:
+                same_content[item["content_hash"]] = []
+                futures[pool.submit(upload_document, container_client, item, local_base, config)] = item
+
+        for future in as_completed(futures):
+            item = futures[future]
+            duplicates = same_content[item["content_hash"]]
             try:
-                with open(txt_path, "rb") as data:
-                    container_client.upload_blob(
-                        name=blob_txt_path,
-                        data=data,
-                        overwrite=True,
-                        content_settings=ContentSettings(content_type="text/plain")
-                    )
-                uploaded_count += 1
-                
+                blob_pdf_path, uploaded, sizes, (pdf_hash, pdf_size) = future.result()
             except Exception as e:
-                print(f"Failed to upload TXT {txt_path}: {e}")
+                failed_count += 1 + len(duplicates)
+                print(f" Failed to upload PDF {item['pdf_path']}: {e}")
+                continue
+            uploaded_count += uploaded
+            reused_count += len(duplicates)
+            for kind, before, after in sizes:
+                storage_stats.record(kind, before, after)
+            for document in [item] + duplicates:
+                pending_updates.append((document, blob_pdf_path, pdf_hash, pdf_size))
+            if len(pending_updates) >= config["dbBatchSize"]:
+                flush_updates()
 
+    flush_updates()
+    content_store.close()
+    for item in downloaded_files:
+        # release what zero-disk mode held in memory
+        if item.get("buffer") is not None:
+            item["buffer"].close()
+        item.pop("text", None)
     print(f"\nUploaded {uploaded_count} file(s) (.pdf/.txt) to Azure Blob Storage.")
+    print(f"Skipped {reused_count} PDF(s) already in storage, {failed_count} failed.")
+    if storage_stats.before:
+        print(f"Storage format: {storage_stats.summary()}, {storage_stats.saved() / 1e6:.1f} MB saved.")
 
-    if os.path.exists(local_base):
+    if not remove_local_base:
+        remove_local_files(downloaded_files)
+    elif os.path.exists(local_base):
         try:
             shutil.rmtree(local_base)
             print(f"Deleted local folder and all contents: {local_base}")
         except Exception as e:
                 print(f"Failed to delete folder {local_base}: {e}")
-
-    
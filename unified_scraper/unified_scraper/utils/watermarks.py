@@ -0,0 +1,106 @@
+import os
+import time
+import sqlite3
+import logging
+from datetime import date, timedelta
+
+WATERMARK_FILE = os.getenv("WATERMARK_FILE", "watermarks.sqlite")
+
+
+class WatermarkStore:
+    """
+    Per court, bench and case type ("" where a court has none), the last day
+    whose search results were crawled to the last page and stored in MetaData.
+    Lives in WATERMARK_FILE (SQLite); a watermark only ever moves forward.
+    Spiders start from it minus CRAWL_OVERLAP_DAYS (see crawl_start) instead of
+    re-crawling their whole window every run.
+
+    Days the court would not list in full (too many results) are kept apart in
+    the over_limit table: they count as covered for the watermark, so one such
+    day cannot hold it back for good, and stay listed until a later search of
+    that day is stored in full.
+    """
+
+    def __init__(self, path=WATERMARK_FILE):
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(path or ":memory:", timeout=30)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " court TEXT, bench TEXT, case_type TEXT, crawled_through TEXT, updated_at REAL,"
+            " PRIMARY KEY (court, bench, case_type))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS over_limit ("
+            " court TEXT, bench TEXT, case_type TEXT, day TEXT, seen_at REAL,"
+            " PRIMARY KEY (court, bench, case_type, day))"
+        )
+        self.db.commit()
+
+    def get(self, court, bench="", case_type=""):
+        row = self.db.execute(
+            "SELECT crawled_through FROM watermarks WHERE court = ? AND bench = ? AND case_type = ?",
+            (court, bench or "", case_type or ""),
+        ).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def advance(self, court, day, bench="", case_type=""):
+        """Record that everything up to `day` is crawled; an older `day` changes nothing."""
+        # ISO dates compare correctly as text
+        self.db.execute(
+            "INSERT INTO watermarks (court, bench, case_type, crawled_through, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (court, bench, case_type) DO UPDATE SET "
+            " crawled_through = MAX(crawled_through, excluded.crawled_through), updated_at = excluded.updated_at",
+            (court, bench or "", case_type or "", day.isoformat(), time.time()),
+        )
+        self.db.commit()
+
+    def mark_over_limit(self, court, day, bench="", case_type=""):
+        self.db.execute(
+            "INSERT OR REPLACE INTO over_limit (court, bench, case_type, day, seen_at) VALUES (?, ?, ?, ?, ?)",
+            (court, bench or "", case_type or "", day.isoformat(), time.time()),
+        )
+        self.db.commit()
+
+    def clear_over_limit(self, court, days, bench="", case_type=""):
+        """Drop `days` from the over-limit list once they have been stored in full."""
+        self.db.executemany(
+            "DELETE FROM over_limit WHERE court = ? AND bench = ? AND case_type = ? AND day = ?",
+            [(court, bench or "", case_type or "", day.isoformat()) for day in days],
+        )
+        self.db.commit()
+
+    def over_limit_days(self, court, bench="", case_type=""):
+        rows = self.db.execute(
+            "SELECT day FROM over_limit WHERE court = ? AND bench = ? AND case_type = ?",
+            (court, bench or "", case_type or ""),
+        ).fetchall()
+        return {date.fromisoformat(row[0]) for row in rows}
+
+    def close(self):
+        self.db.close()
+
+
+def crawl_start(settings, watermark, default_days, today=None):
+    """
+    First day a spider searches: CRAWL_OVERLAP_DAYS before the `watermark`, so
+    judgments published late are still picked up, and as far back as the
+    watermark is, so days missed by failed runs are caught up, but never before
+    the backfill window: the spider's `default_days` (or CRAWL_BACKFILL_DAYS).
+    A watermark that is stuck therefore cannot grow the window run after run.
+    Without a watermark, or with CRAWL_BACKFILL, that window is crawled in full.
+    """
+    today = today or date.today()
+    window_start = today - timedelta(days=settings.getint("CRAWL_BACKFILL_DAYS") or default_days)
+    if watermark is None or settings.getbool("CRAWL_BACKFILL"):
+        return window_start
+    return max(window_start, min(today, watermark - timedelta(days=settings.getint("CRAWL_OVERLAP_DAYS", 3))))
+
+
+def verified_through(start, days):
+    """Last day of the unbroken run of `days` (a set of dates) from `start`, or None."""
+    through = None
+    day = start
+    while day in days:
+        through = day
+        day += timedelta(days=1)
+    return through